@@ -0,0 +1,37 @@
+"""unique user role pair
+
+Revision ID: 3b7e9c1d5a24
+Revises: 85760cbd132a
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3b7e9c1d5a24'
+down_revision = '85760cbd132a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Оставляем по одной записи на пару Пользователь-Роль: с самой поздней датой окончания
+    op.execute(
+        """
+        DELETE FROM users_roles
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY user_id, role_id ORDER BY expired_at DESC NULLS FIRST
+                ) AS position
+                FROM users_roles
+            ) AS ranked
+            WHERE ranked.position > 1
+        );
+        """
+    )
+    op.create_unique_constraint('users_roles_user_role_uc', 'users_roles', ['user_id', 'role_id'])
+
+
+def downgrade():
+    op.drop_constraint('users_roles_user_role_uc', 'users_roles', type_='unique')
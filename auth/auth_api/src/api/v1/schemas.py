@@ -46,6 +46,25 @@ class RoleName(Schema):
     date = af_fields.String(required=True)
 
 
+class UserRoleItem(Schema):
+    user_id = af_fields.UUID(required=True)
+    name = af_fields.String(required=True)
+    date = af_fields.String(required=False)
+
+
+class UserRolesBulkIn(Schema):
+    items = af_fields.List(af_fields.Nested(UserRoleItem), required=True, validate=Length(min=1, max=1000))
+
+
+class UserRoleRejected(UserRoleItem):
+    reason = af_fields.String()
+
+
+class UserRolesBulkOut(Schema):
+    result = af_fields.Integer()
+    rejected = af_fields.List(af_fields.Nested(UserRoleRejected))
+
+
 class LoginInfo(Schema):
     """Модель для информации, которую Юзер передает при авторизации"""
     email = af_fields.Email(required=True,
@@ -2,7 +2,8 @@ from apiflask import APIBlueprint, abort, pagination_builder
 from flask_security.utils import hash_password
 from marshmallow.fields import Boolean
 
-from src.api.v1.schemas import UserIn, UserOut, AuthHistoryOut, RoleName, RoleOut, AuthHistoryQuery
+from src.api.v1.schemas import UserIn, UserOut, AuthHistoryOut, RoleName, RoleOut, AuthHistoryQuery, UserRolesBulkIn, \
+    UserRolesBulkOut
 from src.api.v1.roles import validate_uuid
 from src.services import user as user_service, role as role_service
 from src.services.jwt_service import check_role_jwt, auth
@@ -60,6 +61,47 @@ def get_auth_history(query):
     }
 
 
+def _split_bulk_items(items):
+    """Делит элементы bulk-запроса на применимые и отклоненные
+
+    Несуществующий Пользователь или Роль отклоняет только свои элементы, а не весь запрос,
+    поэтому один удаленный Пользователь не мешает выдать Роли остальным.
+    """
+    missing_users = user_service.get_missing_user_ids({item['user_id'] for item in items})
+    roles = role_service.get_roles_by_names({item['name'] for item in items})
+    valid, rejected = [], []
+    for item in items:
+        if item['user_id'] in missing_users:
+            rejected.append({**item, 'reason': 'user not found'})
+        elif item['name'] not in roles:
+            rejected.append({**item, 'reason': 'role not found'})
+        else:
+            valid.append(item)
+    return valid, roles, rejected
+
+
+@users_route.post('/roles')
+@users_route.input(UserRolesBulkIn)
+@users_route.output(UserRolesBulkOut)
+@users_route.auth_required(auth)
+@check_role_jwt(api_settings.superuser_role_name)
+def add_roles_to_users(data):
+    items, roles, rejected = _split_bulk_items(data['items'])
+    result = user_service.add_roles_to_users(items, roles) if items else 0
+    return {'result': result, 'rejected': rejected}
+
+
+@users_route.delete('/roles')
+@users_route.input(UserRolesBulkIn)
+@users_route.output(UserRolesBulkOut)
+@users_route.auth_required(auth)
+@check_role_jwt(api_settings.superuser_role_name)
+def remove_roles_from_users(data):
+    items, roles, rejected = _split_bulk_items(data['items'])
+    result = user_service.remove_roles_from_users(items, roles) if items else 0
+    return {'result': result, 'rejected': rejected}
+
+
 @users_route.post('/<user_id>/roles')
 @users_route.input(RoleName)
 @users_route.output({'result': Boolean()})
@@ -11,6 +11,7 @@ from src.db.pg_db import db
 
 class UsersRoles(db.Model):
     __tablename__ = 'users_roles'
+    __table_args__ = (UniqueConstraint('user_id', 'role_id', name='users_roles_user_role_uc'),)
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'))
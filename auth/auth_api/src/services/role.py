@@ -19,6 +19,11 @@ def get_role_by_name_or_404(name):
     return Role.query.filter_by(name=name).first_or_404()
 
 
+def get_roles_by_names(names):
+    """Возвращает словарь имя -> Роль для существующих Ролей из names"""
+    return {role.name: role for role in Role.query.filter(Role.name.in_(names))}
+
+
 def create_role_in_db(data):
     role = Role(**data)
     db.session.add(role)
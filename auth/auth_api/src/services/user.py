@@ -1,7 +1,8 @@
 from datetime import datetime
 
 from flask import current_app
-from sqlalchemy import or_
+from sqlalchemy import or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from src.core.utils import useragent_device_parser
 from src.db.pg_db import db
 from src.models.models import AuthHistory, Role, User, UsersRoles
@@ -68,6 +69,48 @@ def remove_role_from_user(user, role):
     return False
 
 
+def add_roles_to_users(items, roles):
+    """Одной транзакцией выдает Роли списку Пользователей
+
+    items - словари с user_id, name (имя Роли) и date (дата окончания, может отсутствовать),
+    roles - Роли из items по именам. Уже выданная Роль не дублируется: у нее обновляется
+    дата окончания, поэтому повторная выдача при продлении подписки безопасна.
+    """
+    # ON CONFLICT не может обновить одну строку дважды, поэтому повторы пары схлопываем: побеждает последний
+    values = {
+        (item['user_id'], roles[item['name']].id): {
+            'user_id': item['user_id'],
+            'role_id': roles[item['name']].id,
+            'expired_at': datetime.strptime(item['date'], '%Y-%m-%d') if item.get('date') else None,
+        }
+        for item in items
+    }
+    query = insert(UsersRoles).values(list(values.values()))
+    query = query.on_conflict_do_update(
+        constraint='users_roles_user_role_uc',
+        set_={'expired_at': query.excluded.expired_at},
+    )
+    result = db.session.execute(query)
+    db.session.commit()
+    return result.rowcount
+
+
+def remove_roles_from_users(items, roles):
+    """Одной транзакцией отзывает Роли у списка Пользователей"""
+    pairs = [(item['user_id'], roles[item['name']].id) for item in items]
+    result = db.session.execute(
+        UsersRoles.__table__.delete().where(tuple_(UsersRoles.user_id, UsersRoles.role_id).in_(pairs))
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def get_missing_user_ids(user_ids):
+    """Возвращает те id из user_ids, для которых нет Пользователя"""
+    existing = {user_id for user_id, in db.session.query(User.id).filter(User.id.in_(user_ids))}
+    return set(user_ids) - existing
+
+
 def get_actual_user_roles(user):
     user_roles = [role.name for role in user.roles]
     if current_app.config['SUPERUSER_ROLE_NAME'] in user_roles:
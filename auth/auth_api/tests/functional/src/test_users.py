@@ -117,3 +117,55 @@ def test_add_role_to_user(session_client, create_user_with_role, create_admin_wi
     response = session_client.post(f'/auth/api/v1/users/{create_user_with_role.id}/roles', headers=headers, json=role)
     assert response.status_code == 200
     assert response.json == {"result": True}
+
+
+def test_add_roles_to_users_bulk(session_client, create_user_with_role, create_admin_with_role):
+    """
+    Проверка выдачи админом ролей нескольким пользователям одним запросом
+    """
+    access_token = jwt_service.add_new_token_pair(create_admin_with_role)['access_token']
+    headers = {'Authorization': f'Bearer {access_token}'}
+    payload = {
+        'items': [
+            {'user_id': str(create_user_with_role.id), 'name': 'admin', 'date': '2030-01-01'},
+            {'user_id': str(create_admin_with_role.id), 'name': 'user', 'date': '2030-01-01'},
+        ]
+    }
+    response = session_client.post('/auth/api/v1/users/roles', headers=headers, json=payload)
+    assert response.status_code == 200
+    assert response.json == {'result': 2, 'rejected': []}
+
+    # Повторная выдача только продлевает роль, а не дублирует ее
+    payload['items'][0]['date'] = '2031-01-01'
+    response = session_client.post('/auth/api/v1/users/roles', headers=headers, json=payload)
+    assert response.status_code == 200
+
+    response = session_client.delete('/auth/api/v1/users/roles', headers=headers, json=payload)
+    assert response.status_code == 200
+    assert response.json == {'result': 2, 'rejected': []}
+
+
+def test_add_roles_to_users_bulk_partially_rejected(session_client, create_user_with_role, create_admin_with_role):
+    """
+    Проверка bulk-выдачи, в которой есть несуществующие роль и пользователь: остальные роли выдаются
+    """
+    access_token = jwt_service.add_new_token_pair(create_admin_with_role)['access_token']
+    headers = {'Authorization': f'Bearer {access_token}'}
+    unknown_user_id = '00000000-0000-4000-8000-000000000000'
+    payload = {
+        'items': [
+            {'user_id': str(create_user_with_role.id), 'name': 'admin', 'date': '2030-01-01'},
+            {'user_id': str(create_user_with_role.id), 'name': 'unknown', 'date': '2030-01-01'},
+            {'user_id': unknown_user_id, 'name': 'admin', 'date': '2030-01-01'},
+        ]
+    }
+    response = session_client.post('/auth/api/v1/users/roles', headers=headers, json=payload)
+    assert response.status_code == 200
+    assert response.json['result'] == 1
+    assert sorted((item['user_id'], item['name'], item['reason']) for item in response.json['rejected']) == [
+        (unknown_user_id, 'admin', 'user not found'),
+        (str(create_user_with_role.id), 'unknown', 'role not found'),
+    ]
+
+    response = session_client.get(f'/auth/api/v1/users/{create_user_with_role.id}/roles', headers=headers)
+    assert 'admin' in {role['name'] for role in response.json}
@@ -0,0 +1,22 @@
+"""index event_ids by received_at for retention cleanup
+
+Revision ID: 0a4c7e2d9b61
+Revises: 5e3b8f1a7c26
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0a4c7e2d9b61'
+down_revision = '5e3b8f1a7c26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_event_ids_received_at'), 'event_ids', ['received_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_event_ids_received_at'), table_name='event_ids')
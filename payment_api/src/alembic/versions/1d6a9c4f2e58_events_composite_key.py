@@ -0,0 +1,41 @@
+"""events primary key (received_at, payment_system_id)
+
+Revision ID: 1d6a9c4f2e58
+Revises: 3f7b2e8d6a14
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '1d6a9c4f2e58'
+down_revision = '3f7b2e8d6a14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Пачка вебхуков вставляется одним запросом, и received_at у ее строк может совпадать,
+    # поэтому строку события однозначно определяет только пара (received_at, payment_system_id).
+    # Ключ партиции received_at обязан входить в первичный ключ партицированной таблицы
+    op.alter_column('events', 'payment_system_id', existing_type=sa.String(), nullable=False)
+    op.drop_constraint('events_pkey', 'events', type_='primary')
+    op.create_primary_key('events_pkey', 'events', ['received_at', 'payment_system_id'])
+    # Очередь Менеджера листается по тому же составному ключу
+    op.drop_index('ix_events_unprocessed', table_name='events')
+    op.create_index(
+        'ix_events_unprocessed', 'events', ['received_at', 'payment_system_id'], unique=False,
+        postgresql_where=sa.text('processed = false'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_events_unprocessed', table_name='events')
+    op.create_index(
+        'ix_events_unprocessed', 'events', ['received_at'], unique=False,
+        postgresql_where=sa.text('processed = false'),
+    )
+    op.drop_constraint('events_pkey', 'events', type_='primary')
+    op.create_primary_key('events_pkey', 'events', ['received_at'])
+    op.alter_column('events', 'payment_system_id', existing_type=sa.String(), nullable=True)
@@ -0,0 +1,30 @@
+"""partial and lookup indexes for events
+
+Revision ID: 2f9b6d4c8e13
+Revises: 8c4e2d7a91f0
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '2f9b6d4c8e13'
+down_revision = '8c4e2d7a91f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Индекс на партицированной таблице Postgres сам создает во всех существующих партициях
+    # и в тех, что будут присоединены позже
+    op.create_index(
+        'ix_events_unprocessed', 'events', ['received_at'], unique=False,
+        postgresql_where=sa.text('processed = false'),
+    )
+    op.create_index('ix_events_payment_system_id', 'events', ['payment_system_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_events_payment_system_id', table_name='events')
+    op.drop_index('ix_events_unprocessed', table_name='events')
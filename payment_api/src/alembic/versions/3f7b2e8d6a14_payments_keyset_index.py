@@ -0,0 +1,24 @@
+"""composite index for keyset pagination of paid payments
+
+Revision ID: 3f7b2e8d6a14
+Revises: 6c1e9a3f5b80
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3f7b2e8d6a14'
+down_revision = '6c1e9a3f5b80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_payments_user_paid_end_date_id', 'payments', ['user_id', 'is_paid', 'end_date', 'id'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_payments_user_paid_end_date_id', table_name='payments')
@@ -0,0 +1,38 @@
+"""retry scheduling and dead letter table for events
+
+Revision ID: 4e8a1c7b3d95
+Revises: 7d3a5e1b4c62
+Create Date: 2026-10-18 14:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '4e8a1c7b3d95'
+down_revision = '7d3a5e1b4c62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('events', sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('events', sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('events', sa.Column('last_error', sa.Text(), nullable=True))
+    op.create_table('dead_events',
+    sa.Column('payment_system_id', sa.String(), nullable=False),
+    sa.Column('received_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('data', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('failed_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.PrimaryKeyConstraint('payment_system_id')
+    )
+
+
+def downgrade():
+    op.drop_table('dead_events')
+    op.drop_column('events', 'last_error')
+    op.drop_column('events', 'next_attempt_at')
+    op.drop_column('events', 'attempts')
@@ -0,0 +1,47 @@
+"""notify payment manager about new events
+
+Revision ID: 5a1f3c9e2b7d
+Revises: bd8c07479b7d
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5a1f3c9e2b7d'
+down_revision = 'bd8c07479b7d'
+branch_labels = None
+depends_on = None
+
+# Канал, который слушает payment_manager (MANAGER_EVENTS_CHANNEL)
+EVENTS_CHANNEL = 'new_events'
+
+
+def upgrade():
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION notify_new_events() RETURNS trigger AS $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM new_events) THEN
+                PERFORM pg_notify('{EVENTS_CHANNEL}', '');
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    # Триггер уровня оператора: пачка INSERT'ов в одной транзакции дает одно уведомление,
+    # а Postgres доставит его только после COMMIT
+    op.execute(
+        """
+        CREATE TRIGGER events_notify_new_events
+        AFTER INSERT ON events
+        REFERENCING NEW TABLE AS new_events
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_new_events();
+        """
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS events_notify_new_events ON events;')
+    op.execute('DROP FUNCTION IF EXISTS notify_new_events();')
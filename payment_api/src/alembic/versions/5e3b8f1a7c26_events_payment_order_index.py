@@ -0,0 +1,32 @@
+"""index unprocessed events by payment for in-order claiming
+
+Revision ID: 5e3b8f1a7c26
+Revises: 1d6a9c4f2e58
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5e3b8f1a7c26'
+down_revision = '1d6a9c4f2e58'
+branch_labels = None
+depends_on = None
+
+PAYMENT_KEY = (
+    "coalesce(data -> 'data' -> 'object' ->> 'payment_intent', data -> 'data' -> 'object' ->> 'id')"
+)
+
+
+def upgrade():
+    # Менеджер не захватывает событие, пока есть более раннее необработанное событие того же платежа.
+    # Выражение совпадает с payment_key в payment_manager; новые партиции получают индекс при ATTACH
+    op.create_index(
+        'ix_events_unprocessed_payment', 'events', [sa.text(PAYMENT_KEY), 'received_at', 'payment_system_id'],
+        unique=False, postgresql_where=sa.text('processed = false'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_events_unprocessed_payment', table_name='events')
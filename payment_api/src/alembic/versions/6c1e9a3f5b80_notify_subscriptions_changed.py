@@ -0,0 +1,43 @@
+"""notify workers about subscription catalog changes
+
+Revision ID: 6c1e9a3f5b80
+Revises: 9b2d6f4a1e37
+Create Date: 2026-10-18 15:30:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '6c1e9a3f5b80'
+down_revision = '9b2d6f4a1e37'
+branch_labels = None
+depends_on = None
+
+# Канал, который слушает каталог Подписок (SUBSCRIPTION_CATALOG_CHANNEL)
+SUBSCRIPTIONS_CHANNEL = 'subscriptions_changed'
+
+
+def upgrade():
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION notify_subscriptions_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{SUBSCRIPTIONS_CHANNEL}', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    # Любое изменение каталога, в том числе не через API, сбрасывает кэши всех воркеров после COMMIT
+    op.execute(
+        """
+        CREATE TRIGGER subscriptions_notify_changed
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON subscriptions
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_subscriptions_changed();
+        """
+    )
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS subscriptions_notify_changed ON subscriptions;')
+    op.execute('DROP FUNCTION IF EXISTS notify_subscriptions_changed();')
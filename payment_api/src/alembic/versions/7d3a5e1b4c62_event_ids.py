@@ -0,0 +1,36 @@
+"""event_ids registry for idempotent webhook ingest
+
+Revision ID: 7d3a5e1b4c62
+Revises: 2f9b6d4c8e13
+Create Date: 2026-10-18 13:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7d3a5e1b4c62'
+down_revision = '2f9b6d4c8e13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('event_ids',
+    sa.Column('payment_system_id', sa.String(), nullable=False),
+    sa.Column('received_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+    sa.PrimaryKeyConstraint('payment_system_id')
+    )
+    op.execute(
+        """
+        INSERT INTO event_ids (payment_system_id, received_at)
+        SELECT payment_system_id, min(received_at) FROM events
+        WHERE payment_system_id IS NOT NULL
+        GROUP BY payment_system_id
+        ON CONFLICT DO NOTHING;
+        """
+    )
+
+
+def downgrade():
+    op.drop_table('event_ids')
@@ -0,0 +1,25 @@
+"""lease columns for event claiming
+
+Revision ID: 8c4e2d7a91f0
+Revises: 5a1f3c9e2b7d
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8c4e2d7a91f0'
+down_revision = '5a1f3c9e2b7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('events', sa.Column('claimed_by', sa.String(), nullable=True))
+    op.add_column('events', sa.Column('claimed_until', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column('events', 'claimed_until')
+    op.drop_column('events', 'claimed_by')
@@ -0,0 +1,22 @@
+"""unique index on payments.intent_id
+
+Revision ID: 9b2d6f4a1e37
+Revises: 4e8a1c7b3d95
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '9b2d6f4a1e37'
+down_revision = '4e8a1c7b3d95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_payments_intent_id'), 'payments', ['intent_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_payments_intent_id'), table_name='payments')
@@ -3,3 +3,4 @@ subscription_not_found = 'Subscription not found'
 no_user = "User doesn't exist"
 no_payment = 'Payment not found or unpaid'
 duplication_subscription = 'Subscription already registered'
+invalid_cursor = 'Invalid page cursor'
@@ -1,4 +1,12 @@
-from fastapi import Query
+import base64
+import datetime
+from http import HTTPStatus
+from typing import Optional, Tuple
+
+import orjson
+from fastapi import HTTPException, Query
+
+from api.v1 import error_descriptions as error_texts
 
 
 class Paginator:
@@ -12,6 +20,25 @@ class Paginator:
             le=500,  # noqa: WPS432
         ),
             page: int = Query(default=1, alias='page[number]', description='Номер страницы', ge=1),
+            after: Optional[str] = Query(
+                default=None,
+                alias='page[after]',
+                description='Курсор из meta.next_after предыдущей страницы; с ним page[number] не учитывается',
+            ),
     ):
         self.per_page = per_page
         self.page = page
+        self.after = decode_cursor(after) if after else None
+
+
+def encode_cursor(end_date: datetime.date, payment_id: int) -> str:
+    """Непрозрачный курсор keyset пагинации по (end_date, id) последней строки страницы"""
+    return base64.urlsafe_b64encode(orjson.dumps([end_date.isoformat(), payment_id])).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.date, int]:
+    try:
+        end_date, payment_id = orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.date.fromisoformat(end_date), int(payment_id)
+    except (ValueError, TypeError, orjson.JSONDecodeError):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=error_texts.invalid_cursor)
@@ -7,7 +7,7 @@ from starlette.responses import JSONResponse
 
 from api.v1 import schemas
 from api.v1 import error_descriptions as error_texts
-from api.v1.paginator import Paginator
+from api.v1.paginator import Paginator, encode_cursor
 from api.v1.schemas import AutoPayment
 from core.config import settings
 from schema.product import Product, ProductData
@@ -44,7 +44,7 @@ async def create_payment(
     if db_payment:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=error_texts.payment_period_not_over)
 
-    subscription = await subscription_service.get_subscription_by_title(payment.subscription)
+    subscription = await subscription_service.get_catalog_subscription(payment.subscription)
     if not subscription:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=error_texts.subscription_not_found)
 
@@ -76,22 +76,33 @@ async def get_paid_payments(
         payment_service: PaymentService = Depends(get_payment_service),
 ):
     """
-        Return paid payments by user:
+        Return paid payments by user ordered by end date:
         - **page[size]**: size of page
         - **page[number]**: number of page
+        - **page[after]**: cursor from meta.next_after of the previous page
         """
-    db_payments = await payment_service.get_paid_payments(
-        offset=paginator.page - 1,
-        limit=paginator.per_page,
+    # Лишняя строка показывает, есть ли следующая страница
+    rows = await payment_service.get_paid_payments(
+        offset=(paginator.page - 1) * paginator.per_page,
+        limit=paginator.per_page + 1,
         user_id=str(user.id),
+        after=paginator.after,
     )
+    page_rows = rows[:paginator.per_page]
+    next_after = None
+    if len(rows) > paginator.per_page:
+        next_after = encode_cursor(page_rows[-1].end_date, page_rows[-1].id)
 
     return schemas.PaymentOutSchema(
         meta=schemas.Pagination(
             page=paginator.page,
             per_page=paginator.per_page,
+            next_after=next_after,
         ),
-        data=[schemas.PaymentOut(**db_payment.__dict__) for db_payment in db_payments],
+        data=[
+            schemas.PaymentOut(subscription=row.subscription, start_date=row.start_date, end_date=row.end_date)
+            for row in page_rows
+        ],
     )
 
 
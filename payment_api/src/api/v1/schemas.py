@@ -1,4 +1,5 @@
 from datetime import date
+from typing import Optional
 from uuid import UUID
 
 from pydantic import BaseModel
@@ -21,6 +22,8 @@ class PaymentOut(Payment):
 class Pagination(BaseModel):
     per_page: int
     page: int
+    # Курсор следующей страницы для page[after], None на последней странице
+    next_after: Optional[str] = None
 
 
 class PaymentOutSchema(BaseModel):
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 
 from pydantic import BaseSettings, SecretStr
 
@@ -14,10 +15,38 @@ class PostgresSettings(BaseSettings):
     host: str = 'localhost'
     port: int = 5432
     db: str = 'payments'
+    # Пул соединений на процесс: pool_size постоянных и до max_overflow временных сверху
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    # statement_timeout сессии в миллисекундах, 0 - без ограничения
+    statement_timeout: int = 30000
+    # Режим PgBouncer (transaction pooling): без кэша prepared statements и без параметров сессии
+    pgbouncer: bool = False
 
     @property
     def dsn(self):
-        return f'postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}'
+        dsn = f'postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}'
+        if self.pgbouncer:
+            dsn += '?prepared_statement_cache_size=0'
+        return dsn
+
+    @property
+    def asyncpg_dsn(self):
+        """DSN для прямого подключения asyncpg (LISTEN)"""
+        return f'postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}'
+
+    @property
+    def connect_args(self) -> dict:
+        if self.pgbouncer:
+            # PgBouncer не пропускает параметры стартового пакета, statement_timeout
+            # в этом режиме задается для роли: ALTER ROLE ... SET statement_timeout
+            return {'statement_cache_size': 0}
+        if self.statement_timeout:
+            return {'server_settings': {'statement_timeout': str(self.statement_timeout)}}
+        return {}
 
     class Config:
         env_prefix = "POSTGRES_"
@@ -48,6 +77,41 @@ class SentrySettings(DotEnvMixin):
         env_prefix = 'sentry_'
 
 
+class PartitionSettings(DotEnvMixin):
+    # Сколько месяцев вперед держать созданными партиции events
+    months_ahead: int = 3
+    default_partition: bool = True
+    maintenance_enabled: bool = True
+    maintenance_interval: int = 3600
+    # Ретеншн: партиции старше retention_months месяцев выгружаются в archive_dir и удаляются
+    retention_months: int = 12
+    archive_dir: Optional[str] = None
+    archive_format: str = 'jsonl'
+
+    class Config:
+        env_prefix = 'partitions_'
+
+
+class EventBufferSettings(DotEnvMixin):
+    # Буферизованная запись вебхуков: события пишутся пачками раз в flush_interval секунд
+    enabled: bool = False
+    max_batch_size: int = 500
+    flush_interval: float = 0.02
+
+    class Config:
+        env_prefix = 'event_buffer_'
+
+
+class SubscriptionCatalogSettings(DotEnvMixin):
+    # Каталог Подписок в памяти: сбрасывается по NOTIFY из channel и не живет дольше ttl секунд
+    enabled: bool = True
+    ttl: float = 60
+    channel: str = 'subscriptions_changed'
+
+    class Config:
+        env_prefix = 'subscription_catalog_'
+
+
 class Settings(DotEnvMixin):
     uvicorn_reload: bool = True
     project_name: str = 'Payment service'
@@ -55,11 +119,16 @@ class Settings(DotEnvMixin):
     sentry: SentrySettings = SentrySettings()
     jwt_secret: str = '8b82efa703035a2bccaaeeb6d136ee8e59f1ef2c19fff57adaac7d20f7777473'
     jwt_algorithm: str = 'HS256'
+    # Сколько проверенных токенов хранить в LRU, 0 - не кэшировать
+    jwt_cache_size: int = 10000
     debug: bool = False
     secret_key: str = 'S#perS3crEt_9999'
     server_address: str = 'http://localhost:8000/'
     stripe: StripeSecrets = StripeSecrets()
     payment: PaymentSettings = PaymentSettings()
+    partitions: PartitionSettings = PartitionSettings()
+    event_buffer: EventBufferSettings = EventBufferSettings()
+    subscription_catalog: SubscriptionCatalogSettings = SubscriptionCatalogSettings()
     superuser_role_name: str = 'superuser'
 
     class Config:
@@ -1,16 +1,43 @@
+from prometheus_client import Counter, Gauge
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from core.config import settings
 
-engine = create_async_engine(settings.postgres.dsn)
+engine = create_async_engine(
+    settings.postgres.dsn,
+    pool_size=settings.postgres.pool_size,
+    max_overflow=settings.postgres.max_overflow,
+    pool_timeout=settings.postgres.pool_timeout,
+    pool_recycle=settings.postgres.pool_recycle,
+    pool_pre_ping=settings.postgres.pool_pre_ping,
+    connect_args=settings.postgres.connect_args,
+)
 Base = declarative_base()
 
+# Одна фабрика сессий на все приложение
+async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+POOL_CHECKOUTS = Counter('payment_api_db_pool_checkouts_total', 'Connections taken from the pool')
+POOL_CONNECTS = Counter('payment_api_db_pool_connects_total', 'New connections opened by the pool')
+POOL_CHECKED_OUT = Gauge('payment_api_db_pool_checked_out', 'Connections currently in use')
+POOL_CHECKED_OUT.set_function(lambda: engine.pool.checkedout())
+POOL_OVERFLOW = Gauge('payment_api_db_pool_overflow', 'Connections opened above pool_size')
+POOL_OVERFLOW.set_function(lambda: max(engine.pool.overflow(), 0))
+
+
+@event.listens_for(engine.sync_engine, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    POOL_CHECKOUTS.inc()
+
+
+@event.listens_for(engine.sync_engine, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    POOL_CONNECTS.inc()
+
 
 async def get_db() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
     async with async_session() as session:
         yield session
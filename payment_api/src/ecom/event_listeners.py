@@ -1,5 +1,4 @@
 import logging
-from functools import lru_cache
 
 import stripe
 
@@ -35,6 +34,5 @@ class StripeEventListener(EcomEventListener):
         return event.id
 
 
-@lru_cache()
 def get_event_parser() -> EcomEventListener:
     return event_listener
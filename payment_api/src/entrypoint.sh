@@ -1,3 +1,4 @@
 #!/bin/sh
 alembic upgrade head
+python manage.py create-partitions
 gunicorn -k uvicorn.workers.UvicornWorker --bind "0.0.0.0:8000" main:app
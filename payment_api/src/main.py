@@ -1,11 +1,16 @@
+import asyncio
+
 import uvicorn
 import sentry_sdk
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
+from prometheus_client import make_asgi_app
 
 from api.v1 import payments, subscriptions, refunds, webhook
 from core.config import settings
+from db.postgres import engine
 from ecom import abstract, event_listeners, stripe_api
+from services import event, event_buffer, partitions, subscription_catalog
 
 sentry_sdk.init(
     dsn=settings.sentry.dsn,
@@ -29,17 +34,42 @@ async def startup():
     )
     event_listeners.event_listener = event_listeners.StripeEventListener(
         endpoint_secret=settings.stripe.endpoint_secret.get_secret_value())
+    if settings.event_buffer.enabled:
+        event_buffer.event_buffer = event_buffer.EventWriteBuffer(
+            engine=engine,
+            insert_events=event.insert_events,
+            max_batch_size=settings.event_buffer.max_batch_size,
+            flush_interval=settings.event_buffer.flush_interval,
+        )
+        event_buffer.event_buffer.start()
+    if settings.subscription_catalog.enabled:
+        subscription_catalog.subscription_catalog = subscription_catalog.SubscriptionCatalog(
+            engine=engine,
+            dsn=settings.postgres.asyncpg_dsn,
+            channel=settings.subscription_catalog.channel,
+            ttl=settings.subscription_catalog.ttl,
+        )
+    if settings.partitions.maintenance_enabled:
+        partitions.maintenance_task = asyncio.create_task(
+            partitions.get_partition_maintainer().run_periodically(settings.partitions.maintenance_interval)
+        )
 
 
 @app.on_event('shutdown')
 async def shutdown():
-    ...
+    if partitions.maintenance_task:
+        partitions.maintenance_task.cancel()
+    if event_buffer.event_buffer:
+        await event_buffer.event_buffer.stop()
+    if subscription_catalog.subscription_catalog:
+        await subscription_catalog.subscription_catalog.close()
 
 
 app.include_router(payments.router, prefix='/api/v1/payments', tags=['payments'])
 app.include_router(subscriptions.router, prefix='/api/v1/subscriptions', tags=['subscriptions'])
 app.include_router(refunds.router, prefix='/api/v1/refunds', tags=['refunds'])
 app.include_router(webhook.router, prefix='/api/v1/webhook', tags=['webhook'])
+app.mount('/metrics', make_asgi_app())
 
 if __name__ == '__main__':
     uvicorn.run(
@@ -0,0 +1,74 @@
+"""Служебные команды сервиса оплат.
+
+    python manage.py create-partitions [--months-ahead N]
+    python manage.py apply-retention [--keep-months N] [--archive-dir DIR] [--format jsonl|csv]
+    python manage.py list-dead-events [--limit N]
+    python manage.py redrive-events (--all | EVENT_ID [EVENT_ID ...])
+"""
+import argparse
+import asyncio
+
+from core.config import settings
+from db.postgres import engine
+from services.dead_events import get_dead_event_queue
+from services.partitions import ARCHIVE_FORMATS, get_partition_maintainer
+
+
+async def create_partitions(args) -> None:
+    created = await get_partition_maintainer(months_ahead=args.months_ahead).create_partitions()
+    print(f'Created partitions: {", ".join(created) or "none"}')
+
+
+async def apply_retention(args) -> None:
+    dropped = await get_partition_maintainer().apply_retention(
+        keep_months=args.keep_months,
+        archive_dir=args.archive_dir,
+        archive_format=args.format,
+    )
+    print(f'Dropped partitions: {", ".join(dropped) or "none"}')
+
+
+async def list_dead_events(args) -> None:
+    for event_id, received_at, attempts, failed_at, last_error in await get_dead_event_queue().get_dead_events(
+            limit=args.limit):
+        print(f'{event_id}\treceived {received_at}\tfailed {failed_at}\tattempts {attempts}\t{last_error}')
+
+
+async def redrive_events(args) -> None:
+    if not args.all and not args.event_ids:
+        raise SystemExit('Pass event ids or --all')
+    redriven = await get_dead_event_queue().redrive(None if args.all else args.event_ids)
+    print(f'Redriven events: {", ".join(redriven) or "none"}')
+
+
+async def main(args) -> None:
+    try:
+        await args.handler(args)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Payment service management commands')
+    subparsers = parser.add_subparsers(required=True)
+
+    partitions_parser = subparsers.add_parser('create-partitions', help='Create monthly events partitions ahead')
+    partitions_parser.add_argument('--months-ahead', type=int, default=None)
+    partitions_parser.set_defaults(handler=create_partitions)
+
+    retention_parser = subparsers.add_parser('apply-retention', help='Archive and drop old events partitions')
+    retention_parser.add_argument('--keep-months', type=int, default=settings.partitions.retention_months)
+    retention_parser.add_argument('--archive-dir', default=settings.partitions.archive_dir)
+    retention_parser.add_argument('--format', choices=ARCHIVE_FORMATS, default=settings.partitions.archive_format)
+    retention_parser.set_defaults(handler=apply_retention)
+
+    dead_events_parser = subparsers.add_parser('list-dead-events', help='Show events the manager gave up on')
+    dead_events_parser.add_argument('--limit', type=int, default=100)
+    dead_events_parser.set_defaults(handler=list_dead_events)
+
+    redrive_parser = subparsers.add_parser('redrive-events', help='Return dead events to the processing queue')
+    redrive_parser.add_argument('event_ids', nargs='*')
+    redrive_parser.add_argument('--all', action='store_true')
+    redrive_parser.set_defaults(handler=redrive_events)
+
+    asyncio.run(main(parser.parse_args()))
@@ -16,10 +16,15 @@ class Payment(Base):
     subscription_id = sqlalchemy.Column(sqlalchemy.ForeignKey('subscriptions.id'), index=True)
     payment_url = sqlalchemy.Column(sqlalchemy.String)
     is_paid = sqlalchemy.Column(sqlalchemy.Boolean, index=True, default=False)
-    intent_id = sqlalchemy.Column(sqlalchemy.String)
+    intent_id = sqlalchemy.Column(sqlalchemy.String, unique=True, index=True)
     client_secret = sqlalchemy.Column(sqlalchemy.String)
     subscription = relationship("Subscription", back_populates="payments", uselist=False, lazy="joined")
 
+    __table_args__ = (
+        # Keyset пагинация оплаченных платежей пользователя по (end_date, id)
+        sqlalchemy.Index('ix_payments_user_paid_end_date_id', 'user_id', 'is_paid', 'end_date', 'id'),
+    )
+
 
 class Subscription(Base):
     __tablename__ = 'subscriptions'
@@ -40,17 +45,66 @@ class User(Base):
     is_recurrent_payments = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
 
 
+class EventId(Base):
+    """Реестр id событий платежной системы: уникальный ключ делает прием вебхуков идемпотентным"""
+    __tablename__ = 'event_ids'
+
+    payment_system_id = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    # По received_at ретеншн пачками удаляет id событий из удаленных партиций
+    received_at = sqlalchemy.Column(
+        sqlalchemy.DateTime(timezone=True),
+        nullable=False,
+        index=True,
+        server_default=sqlalchemy.text('CURRENT_TIMESTAMP'),
+    )
+
+
 class EventMixin:
-    payment_system_id = sqlalchemy.Column(sqlalchemy.String)
+    # Первичный ключ (received_at, payment_system_id): у строк одной пачки вебхуков received_at может совпасть.
+    # Порядок колонок задает порядок ключа, он должен совпадать с ключом родительской таблицы events
     received_at = sqlalchemy.Column(
         sqlalchemy.DateTime(timezone=True),
         primary_key=True,
         nullable=False,
         server_default=sqlalchemy.text('CURRENT_TIMESTAMP'),
     )
+    payment_system_id = sqlalchemy.Column(sqlalchemy.String, primary_key=True, nullable=False)
     data = sqlalchemy.Column(JSONB)
     processed = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
+    claimed_by = sqlalchemy.Column(sqlalchemy.String)
+    claimed_until = sqlalchemy.Column(sqlalchemy.DateTime(timezone=True))
+    # Неудачные попытки обработки: следующая не раньше next_attempt_at
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = sqlalchemy.Column(sqlalchemy.DateTime(timezone=True))
+    last_error = sqlalchemy.Column(sqlalchemy.Text)
 
 
 class Event(EventMixin, Base, metaclass=PartitionByMonthMeta, partition_by='received_at'):
     __tablename__ = 'events'
+    __table_args__ = (
+        # Очередь Менеджера: индекс содержит только необработанные события, поэтому его размер
+        # зависит от бэклога, а не от всей истории
+        sqlalchemy.Index(
+            'ix_events_unprocessed', 'received_at', 'payment_system_id',
+            postgresql_where=sqlalchemy.text('processed = false'),
+        ),
+        sqlalchemy.Index('ix_events_payment_system_id', 'payment_system_id'),
+        # ix_events_unprocessed_payment по выражению над data создан миграцией 5e3b8f1a7c26:
+        # партиции получают его от родителя при ATTACH PARTITION
+    )
+
+
+class DeadEvent(Base):
+    """События, которые Менеджер так и не смог обработать за отведенное число попыток"""
+    __tablename__ = 'dead_events'
+
+    payment_system_id = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    received_at = sqlalchemy.Column(sqlalchemy.DateTime(timezone=True), nullable=False)
+    data = sqlalchemy.Column(JSONB)
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    last_error = sqlalchemy.Column(sqlalchemy.Text)
+    failed_at = sqlalchemy.Column(
+        sqlalchemy.DateTime(timezone=True),
+        nullable=False,
+        server_default=sqlalchemy.text('CURRENT_TIMESTAMP'),
+    )
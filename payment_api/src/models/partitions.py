@@ -1,7 +1,7 @@
 import datetime
 from typing import Tuple
 
-from sqlalchemy import event
+from sqlalchemy import Index, event
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.sql.ddl import DDL
 
@@ -12,18 +12,25 @@ class PartitionByMonthMeta(DeclarativeMeta):
         def get_partition_name(cls_, key):
             return f'{cls_.__tablename__}_{key[0]}'
 
+        @classmethod
+        def get_partition_key(cls_, day: datetime.date) -> Tuple[str, str, str]:
+            """Ключ партиции месяца, в который попадает day: (суффикс имени, начало, конец)"""
+            month_start = day.replace(day=1)
+            next_month_start = (month_start + datetime.timedelta(days=32)).replace(day=1)
+            return f"y{month_start.year}m{month_start.month}", month_start.isoformat(), next_month_start.isoformat()
+
+        @classmethod
+        def get_default_partition_ddl(cls_) -> DDL:
+            """DDL партиции по умолчанию: в нее попадают строки, для которых не нашлось месяца"""
+            return DDL(
+                f"CREATE TABLE IF NOT EXISTS {cls_.__tablename__}_default "
+                f"PARTITION OF {cls_.__tablename__} DEFAULT;"
+            )
+
         @classmethod
         def create_partition(cls_, key: Tuple[str, str, str] = None):
             if not key:
-                dt = datetime.date.today()
-                key = [
-                    f"y{dt.year}m{dt.month}",
-                    dt.isoformat(),
-                    (dt.replace(
-                        day=1) +
-                        datetime.timedelta(
-                        days=32)).replace(
-                        day=1).isoformat()]
+                key = cls_.get_partition_key(datetime.datetime.now(datetime.timezone.utc).date())
             if key[0] not in cls_.partitions:
                 Partition = type(
                     f'{clsname}{key[0]}',
@@ -32,6 +39,16 @@ class PartitionByMonthMeta(DeclarativeMeta):
                 )
                 Partition.__table__.add_is_dependent_on(cls_.__table__)
 
+                # Индексы родительской таблицы создаются в партиции до ATTACH PARTITION,
+                # и Postgres просто привязывает их к индексам родителя, не перестраивая
+                for index in cls_.__table__.indexes:
+                    Index(
+                        index.name.replace(cls_.__tablename__, Partition.__tablename__, 1),
+                        *[Partition.__table__.c[column.name] for column in index.columns],
+                        unique=index.unique,
+                        **index.dialect_kwargs,
+                    )
+
                 event.listen(
                     Partition.__table__,
                     'after_create',
@@ -54,6 +71,8 @@ class PartitionByMonthMeta(DeclarativeMeta):
                 'partitions': {},
                 'partitioned_by': partition_by,
                 'get_partition_name': get_partition_name,
+                'get_partition_key': get_partition_key,
+                'get_default_partition_ddl': get_default_partition_ddl,
                 'create_partition': create_partition
             }
         )
@@ -1,5 +1,7 @@
+import hashlib
 import logging
 import time
+from collections import OrderedDict
 from functools import wraps
 from http import HTTPStatus
 from typing import Optional, List
@@ -8,6 +10,7 @@ from uuid import UUID
 import jwt
 from fastapi import HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from prometheus_client import Counter, Gauge
 from pydantic import BaseModel
 
 from core.config import settings
@@ -20,6 +23,52 @@ class User(BaseModel):
     roles: List[str]
 
 
+JWT_CACHE_REQUESTS = Counter('payment_api_jwt_cache_requests_total', 'Verified JWT cache lookups', ['result'])
+JWT_CACHE_SIZE = Gauge('payment_api_jwt_cache_size', 'Tokens in the verified JWT cache')
+
+
+class VerifiedTokenCache:
+    """LRU проверенных токенов: повторный запрос с тем же токеном не проверяет подпись заново
+
+    Ключ - sha256 токена, поэтому сами токены в памяти не хранятся. Запись живет до exp
+    токена и проверяется тем же сравнением, что и decode_jwt, так что истечение точное.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._tokens: OrderedDict = OrderedDict()
+        JWT_CACHE_SIZE.set_function(lambda: len(self._tokens))
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[User]:
+        key = self._key(token)
+        cached = self._tokens.get(key)
+        if cached is not None:
+            exp, user = cached
+            if exp >= time.time():
+                self._tokens.move_to_end(key)
+                JWT_CACHE_REQUESTS.labels('hit').inc()
+                return user
+            del self._tokens[key]
+        JWT_CACHE_REQUESTS.labels('miss').inc()
+        return None
+
+    def put(self, token: str, exp: float, user: User) -> None:
+        if self.max_size <= 0:
+            return
+        key = self._key(token)
+        self._tokens[key] = (exp, user)
+        self._tokens.move_to_end(key)
+        while len(self._tokens) > self.max_size:
+            self._tokens.popitem(last=False)
+
+
+token_cache = VerifiedTokenCache(max_size=settings.jwt_cache_size)
+
+
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super().__init__(auto_error=auto_error)
@@ -32,11 +81,16 @@ class JWTBearer(HTTPBearer):
         if credentials.scheme != 'Bearer':
             logger.warning(credentials.scheme)
             raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail='Invalid authentication scheme.')
+        user = token_cache.get(credentials.credentials)
+        if user is not None:
+            return user
         payload = self.verify_jwt(credentials.credentials)
         if not payload:
             logger.warning('PAYLOAD NO')
             raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail='Invalid token or expired token.')
-        return User(id=payload['sub'], roles=payload['roles'])
+        user = User(id=payload['sub'], roles=payload['roles'])
+        token_cache.put(credentials.credentials, payload['exp'], user)
+        return user
 
     def verify_jwt(self, jwtoken: str) -> Optional[dict]:
         try:
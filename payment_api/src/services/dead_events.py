@@ -0,0 +1,65 @@
+import logging
+from typing import List, Optional
+
+from sqlalchemy import String, any_, bindparam, delete, false, insert, literal_column, true
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.future import select
+
+from db.postgres import engine
+from models import models
+
+logger = logging.getLogger(__name__)
+
+
+class DeadEventQueue:
+    """Просмотр и повторный запуск событий, которые Менеджер отложил после max_attempts неудач"""
+
+    def __init__(self, engine: AsyncEngine, model, dead_model):
+        self.engine = engine
+        self.model = model
+        self.dead_model = dead_model
+
+    async def get_dead_events(self, limit: int = 100) -> List[tuple]:
+        """Последние отложенные события: (id, received_at, attempts, failed_at, last_error)"""
+        dead = self.dead_model
+        query = (
+            select(dead.payment_system_id, dead.received_at, dead.attempts, dead.failed_at, dead.last_error)
+            .order_by(dead.failed_at.desc())
+            .limit(limit)
+        )
+        async with self.engine.connect() as conn:
+            return (await conn.execute(query)).all()
+
+    async def redrive(self, event_ids: Optional[List[str]] = None) -> List[str]:
+        """Возвращает события в очередь Менеджера со сброшенным счетчиком попыток
+
+        Без event_ids возвращаются все отложенные события. Перенос идет одним запросом,
+        а триггер NOTIFY на events сразу будит Менеджер.
+        """
+        dead = self.dead_model
+        condition = true() if event_ids is None else (
+            dead.payment_system_id == any_(bindparam('event_ids', event_ids, type_=ARRAY(String)))
+        )
+        moved = (
+            delete(dead)
+            .where(condition)
+            .returning(dead.payment_system_id, dead.received_at, dead.data)
+            .cte('moved')
+        )
+        query = (
+            insert(self.model)
+            .from_select(
+                ['payment_system_id', 'received_at', 'data', 'processed', 'attempts'],
+                select(moved.c.payment_system_id, moved.c.received_at, moved.c.data, false(), literal_column('0')),
+            )
+            .returning(self.model.payment_system_id)
+        )
+        async with self.engine.begin() as conn:
+            redriven = (await conn.execute(query)).scalars().all()
+        logger.warning(f'Redriven {len(redriven)} dead events')
+        return redriven
+
+
+def get_dead_event_queue() -> DeadEventQueue:
+    return DeadEventQueue(engine=engine, model=models.Event, dead_model=models.DeadEvent)
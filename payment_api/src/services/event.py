@@ -1,24 +1,58 @@
 import json
 import logging
-from functools import lru_cache
 from http import HTTPStatus
+from typing import Dict, Optional, Set
 
 from fastapi import Depends, HTTPException
+from sqlalchemy import String, cast, column, false, func, values
+from sqlalchemy.dialects.postgresql import JSONB, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from db.postgres import engine, get_db
+from db.postgres import get_db
 from ecom.abstract import EcomEventListener
 from ecom.event_listeners import get_event_parser
 from models import models
 from services.base import BaseService
+from services.event_buffer import EventWriteBuffer, get_event_buffer
 
 logger = logging.getLogger(__name__)
 
 
+async def insert_events(connection, events: Dict[str, dict]) -> Set[str]:
+    """Сохраняет пачку событий одним запросом, пропуская уже встречавшиеся id
+
+    id событий сначала вставляются в event_ids с ON CONFLICT DO NOTHING, и только
+    новые id попадают в events. Повторная доставка от Stripe, в том числе параллельная,
+    ничего не вставит. Возвращает множество id, которые действительно были записаны.
+    received_at берется из clock_timestamp(), а не из времени начала транзакции,
+    поэтому события пачки упорядочены в порядке вставки.
+    connection - AsyncSession или AsyncConnection, коммит остается за вызывающим.
+    """
+    new_event_ids = (
+        insert(models.EventId)
+        .values([{'payment_system_id': event_id} for event_id in events])
+        .on_conflict_do_nothing(index_elements=[models.EventId.payment_system_id])
+        .returning(models.EventId.payment_system_id)
+        .cte('new_event_ids')
+    )
+    payloads = values(
+        column('payment_system_id', String), column('data', JSONB), name='payloads',
+    ).data(list(events.items()))
+    query = insert(models.Event).from_select(
+        ['payment_system_id', 'received_at', 'data', 'processed'],
+        select(payloads.c.payment_system_id, func.clock_timestamp(), cast(payloads.c.data, JSONB), false())
+        .join(new_event_ids, new_event_ids.c.payment_system_id == payloads.c.payment_system_id),
+    ).returning(models.Event.payment_system_id)
+    result = await connection.execute(query)
+    return set(result.scalars().all())
+
+
 class EventService(BaseService):
-    def __init__(self, session: AsyncSession, event_parser: EcomEventListener):
+    def __init__(self, session: AsyncSession, event_parser: EcomEventListener,
+                 event_buffer: Optional[EventWriteBuffer] = None):
         self.event_parser = event_parser
+        self.event_buffer = event_buffer
         super().__init__(session)
 
     async def save_event(self, payload: bytes, headers: dict):
@@ -27,32 +61,26 @@ class EventService(BaseService):
         except BaseException:
             raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY)
 
-        query = await self.session.execute(
-            select(models.Event).where(models.Event.payment_system_id == event_id)
-        )
-        db_event = query.scalars().first()
-        if db_event:
-            raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="Duplicate")
-        for _ in range(2):
-            try:
-                db_event = models.Event(
-                    payment_system_id=event_id,
-                    data=json.loads(payload)
-                )
-                self.session.add(db_event)
+        try:
+            if self.event_buffer:
+                # Ответ уходит только после того, как пачка с событием закоммичена
+                inserted = await self.event_buffer.put(event_id, json.loads(payload))
+            else:
+                inserted = event_id in await insert_events(self.session, {event_id: json.loads(payload)})
                 await self.session.commit()
-                break
-            except Exception:
-                await self.session.rollback()
-                logger.exception('Writing event data error')
-                Partition = models.Event.create_partition()
-                async with engine.begin() as conn:
-                    await conn.run_sync(Partition.__table__.create)
+        except Exception:
+            # Партиции создаются заранее (services.partitions), поэтому DDL здесь не выполняем:
+            # ответ 500 заставит Stripe доставить событие повторно
+            await self.session.rollback()
+            logger.exception('Writing event data error')
+            raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
+        if not inserted:
+            raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="Duplicate")
 
 
-@lru_cache()
 def get_event_service(
         session: AsyncSession = Depends(get_db),
         event_parser: EcomEventListener = Depends(get_event_parser),
+        event_buffer: Optional[EventWriteBuffer] = Depends(get_event_buffer),
 ) -> EventService:
-    return EventService(session, event_parser)
+    return EventService(session, event_parser, event_buffer)
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+event_buffer = None
+
+
+class EventWriteBuffer:
+    """Копит проверенные события вебхука и записывает их в БД пачками
+
+    Пачка сбрасывается, когда в ней набралось max_batch_size событий или с прихода первого
+    события прошло flush_interval секунд. Запрос вебхука ждет коммита своей пачки, поэтому
+    Stripe получает 200 только для событий, которые уже надежно сохранены.
+    """
+
+    def __init__(self, engine: AsyncEngine, insert_events: Callable[..., Awaitable[Set[str]]],
+                 max_batch_size: int, flush_interval: float):
+        self.engine = engine
+        self.insert_events = insert_events
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Дописывает все, что уже в очереди, и останавливает фоновую запись"""
+        if self._task:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+
+    async def put(self, event_id: str, data: dict) -> bool:
+        """Ставит событие в очередь и ждет коммита. Возвращает False для дубликата"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((event_id, data, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout > 0:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[str, dict, asyncio.Future]]) -> None:
+        events: Dict[str, dict] = {}
+        for event_id, data, _ in batch:
+            events.setdefault(event_id, data)
+        try:
+            async with self.engine.begin() as conn:
+                inserted = await self.insert_events(conn, events)
+        except Exception as e:
+            logger.exception('Writing events batch error')
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        logger.info('Flushed %s events, %s new', len(batch), len(inserted))
+        for event_id, _, future in batch:
+            if not future.done():
+                # Повтор того же события внутри пачки - тоже дубликат
+                future.set_result(event_id in inserted)
+                inserted.discard(event_id)
+
+
+def get_event_buffer() -> Optional[EventWriteBuffer]:
+    return event_buffer
@@ -0,0 +1,242 @@
+import asyncio
+import csv
+import datetime
+import gzip
+import logging
+import os
+import re
+from typing import Dict, List, Optional
+
+import orjson
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, inspect, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.future import select
+
+from core.config import settings
+from db.postgres import engine
+from models import models
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock: партициями одновременно занимается только один процесс
+PARTITION_MAINTENANCE_LOCK = 731001
+# Сколько ждать блокировку events для DETACH без CONCURRENTLY, прежде чем отложить удаление партиции
+DETACH_LOCK_TIMEOUT = '5s'
+# Размер одной транзакции удаления старых id из event_ids
+EVENT_IDS_DELETE_BATCH = 10000
+
+ARCHIVE_FORMATS = ('jsonl', 'csv')
+
+maintenance_task: Optional[asyncio.Task] = None
+
+
+class PartitionMaintainer:
+    """Заранее создает месячные партиции, чтобы запись вебхука никогда не выполняла DDL"""
+
+    def __init__(self, engine: AsyncEngine, model, months_ahead: int, default_partition: bool):
+        self.engine = engine
+        self.model = model
+        self.months_ahead = months_ahead
+        self.default_partition = default_partition
+
+    @staticmethod
+    def _create_table(connection, table) -> bool:
+        if inspect(connection).has_table(table.name):
+            return False
+        table.create(connection)
+        return True
+
+    async def create_partitions(self) -> List[str]:
+        """Создает партиции текущего и months_ahead следующих месяцев, а также партицию по умолчанию
+
+        Возвращает имена созданных таблиц. Месячные партиции создаются раньше партиции
+        по умолчанию, поэтому ATTACH PARTITION не приходится переносить строки из нее.
+        """
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        created = []
+        async with self.engine.begin() as conn:
+            locked = await conn.scalar(select(func.pg_try_advisory_xact_lock(PARTITION_MAINTENANCE_LOCK)))
+            if not locked:
+                logger.info('Partition maintenance is running in another process')
+                return created
+            for months in range(self.months_ahead + 1):
+                key = self.model.get_partition_key(today + relativedelta(months=months))
+                Partition = self.model.create_partition(key)
+                if await conn.run_sync(self._create_table, Partition.__table__):
+                    created.append(Partition.__tablename__)
+            if self.default_partition:
+                await conn.execute(self.model.get_default_partition_ddl())
+        if created:
+            logger.info('Created partitions %s', created)
+        return created
+
+    async def get_partitions(self) -> Dict[str, datetime.date]:
+        """Возвращает присоединенные месячные партиции: имя таблицы -> первый день месяца"""
+        name_pattern = re.compile(rf'^{self.model.__tablename__}_y(\d+)m(\d+)$')
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                text(
+                    """
+                    SELECT child.relname FROM pg_inherits
+                    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                    WHERE parent.relname = :table
+                    """
+                ),
+                {'table': self.model.__tablename__},
+            )
+            partitions = {}
+            for name in result.scalars():
+                match = name_pattern.match(name)
+                if match:
+                    partitions[name] = datetime.date(int(match[1]), int(match[2]), 1)
+            return partitions
+
+    async def _export_partition(self, table_name: str, archive_dir: str, archive_format: str) -> str:
+        """Построчно выгружает партицию в сжатый файл и возвращает путь к нему
+
+        Файл пишется во временный и переименовывается только целиком, поэтому готовый архив
+        означает, что выгружены все строки.
+        """
+        path = os.path.join(archive_dir, f'{table_name}.{archive_format}.gz')
+        tmp_path = f'{path}.tmp'
+        columns = [column.name for column in self.model.__table__.columns]
+        async with self.engine.connect() as conn:
+            rows = await conn.stream(text(f'SELECT {", ".join(columns)} FROM {table_name} ORDER BY received_at'))
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as archive:
+                if archive_format == 'csv':
+                    writer = csv.writer(archive)
+                    writer.writerow(columns)
+                    async for row in rows:
+                        writer.writerow([orjson.dumps(value).decode() if isinstance(value, dict) else value
+                                         for value in row])
+                else:
+                    async for row in rows:
+                        archive.write(orjson.dumps(dict(row._mapping)).decode())
+                        archive.write('\n')
+        os.replace(tmp_path, path)
+        return path
+
+    async def apply_retention(self, keep_months: int, archive_dir: Optional[str] = None,
+                              archive_format: str = 'jsonl') -> List[str]:
+        """Архивирует, отсоединяет и удаляет партиции старше keep_months месяцев
+
+        Партиция, в которой остались необработанные события, не трогается. Полностью обработанная
+        партиция больше не меняется, поэтому выгружается, пока еще присоединена: если выгрузка
+        упадет, партиция останется на месте и попадет в следующий запуск. Отсоединение и удаление
+        выполняются только после того, как архив записан, и не держат блокировку events дольше
+        самого DETACH (см. _drop_partition). Без archive_dir партиции удаляются без выгрузки.
+        Затем пачками удаляются id событий из event_ids, которые старше оставшихся партиций.
+        Возвращает имена удаленных партиций.
+        """
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f'Unknown archive format {archive_format}')
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        cutoff = today.replace(day=1) - relativedelta(months=keep_months)
+        dropped = []
+        async with self.engine.connect() as conn:
+            # Сессионная блокировка переживает отдельные транзакции: одну партицию не выгружают два процесса.
+            # Без statement_timeout: DETACH CONCURRENTLY ждет завершения всех транзакций, видевших партицию
+            conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+            if not await conn.scalar(select(func.pg_try_advisory_lock(PARTITION_MAINTENANCE_LOCK))):
+                logger.info('Partition maintenance is running in another process')
+                return dropped
+            await conn.execute(text('SET statement_timeout = 0'))
+            try:
+                for table_name, month_start in sorted((await self.get_partitions()).items(), key=lambda item: item[1]):
+                    if month_start >= cutoff:
+                        continue
+                    if await self._has_unprocessed(conn, table_name):
+                        logger.warning('Partition %s still has unprocessed events, skip it', table_name)
+                        continue
+                    if archive_dir:
+                        path = await self._export_partition(table_name, archive_dir, archive_format)
+                        logger.info('Partition %s archived to %s', table_name, path)
+                        # Пока шла выгрузка, в партицию могли вернуть событие из dead_events
+                        if await self._has_unprocessed(conn, table_name):
+                            logger.warning('Partition %s got unprocessed events during export, skip it', table_name)
+                            continue
+                    await self._drop_partition(conn, table_name)
+                    self.model.partitions.pop(self.model.get_partition_key(month_start)[0], None)
+                    dropped.append(table_name)
+                # id событий удаляются до начала самой ранней оставшейся партиции: если прошлый запуск
+                # упал после DROP, его id дочистятся сейчас
+                keep_from = min([cutoff, *(await self.get_partitions()).values()])
+                deleted = await self._delete_event_ids(conn, keep_from)
+            finally:
+                await conn.execute(text('RESET statement_timeout'))
+                await conn.execute(select(func.pg_advisory_unlock(PARTITION_MAINTENANCE_LOCK)))
+        if dropped or deleted:
+            logger.info('Dropped partitions %s and %s event ids', dropped, deleted)
+        return dropped
+
+    async def _drop_partition(self, conn, table_name: str) -> None:
+        """Отсоединяет и удаляет партицию, не блокируя запись в events на время удаления
+
+        DETACH PARTITION CONCURRENTLY не берет ACCESS EXCLUSIVE на events, но Postgres запрещает его,
+        если у таблицы есть партиция по умолчанию. Тогда DETACH выполняется отдельной короткой
+        транзакцией с lock_timeout, чтобы не выстраивать за собой очередь запросов.
+        Прерванный CONCURRENTLY оставляет партицию в состоянии pending, его завершает FINALIZE.
+        """
+        parent = self.model.__tablename__
+        state = (await conn.execute(
+            text(
+                """
+                SELECT inhdetachpending, partdefid <> 0 AS has_default FROM pg_inherits
+                JOIN pg_partitioned_table ON partrelid = pg_inherits.inhparent
+                WHERE inhrelid = CAST(:table AS regclass)
+                """
+            ),
+            {'table': table_name},
+        )).one()
+        if state.inhdetachpending:
+            await conn.execute(text(f'ALTER TABLE {parent} DETACH PARTITION {table_name} FINALIZE'))
+        elif state.has_default:
+            async with self.engine.begin() as detach_conn:
+                await detach_conn.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+                await detach_conn.execute(text(f'ALTER TABLE {parent} DETACH PARTITION {table_name}'))
+        else:
+            await conn.execute(text(f'ALTER TABLE {parent} DETACH PARTITION {table_name} CONCURRENTLY'))
+        await conn.execute(text(f'DROP TABLE {table_name}'))
+
+    @staticmethod
+    async def _delete_event_ids(conn, before: datetime.date) -> int:
+        """Пачками по EVENT_IDS_DELETE_BATCH удаляет из event_ids id, полученные раньше before"""
+        deleted = 0
+        while True:
+            result = await conn.execute(
+                text(
+                    """
+                    DELETE FROM event_ids WHERE payment_system_id IN (
+                        SELECT payment_system_id FROM event_ids WHERE received_at < :before LIMIT :batch
+                    )
+                    """
+                ),
+                {'before': before, 'batch': EVENT_IDS_DELETE_BATCH},
+            )
+            deleted += result.rowcount
+            if result.rowcount < EVENT_IDS_DELETE_BATCH:
+                return deleted
+
+    @staticmethod
+    async def _has_unprocessed(conn, table_name: str) -> bool:
+        return await conn.scalar(text(f'SELECT EXISTS (SELECT 1 FROM {table_name} WHERE processed IS NOT TRUE)'))
+
+    async def run_periodically(self, interval: float) -> None:
+        """Фоновая задача: раз в interval секунд проверяет, что партиции созданы"""
+        while True:
+            try:
+                await self.create_partitions()
+            except Exception:
+                logger.exception('Partition maintenance error')
+            await asyncio.sleep(interval)
+
+
+def get_partition_maintainer(months_ahead: int = None) -> PartitionMaintainer:
+    return PartitionMaintainer(
+        engine=engine,
+        model=models.Event,
+        months_ahead=settings.partitions.months_ahead if months_ahead is None else months_ahead,
+        default_partition=settings.partitions.default_partition,
+    )
@@ -1,9 +1,11 @@
 import logging
-from functools import lru_cache
+from datetime import date
 from http import HTTPStatus
+from typing import Optional, Tuple
 
 from dateutil.relativedelta import relativedelta
 from fastapi import Depends, HTTPException
+from sqlalchemy import tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
@@ -46,19 +48,35 @@ class PaymentService(BaseService):
         ))
         return result.scalars().first()
 
-    async def get_paid_payments(self, user_id, offset=1, limit=1, ):
-        """Функция получает все оплаченные платежи пользователя"""
-        result = await self.session.execute(
-            select(models.Payment)
+    async def get_paid_payments(self, user_id, offset=0, limit=1, after: Optional[Tuple[date, int]] = None):
+        """Функция получает оплаченные платежи пользователя, упорядоченные по (end_date, id)
+
+        С курсором after страница начинается сразу за строкой (end_date, id) и читается
+        по индексу (user_id, is_paid, end_date, id), поэтому любая страница стоит как первая.
+        Без курсора пропускается offset строк (пагинация по номеру страницы).
+        Выбираются только поля ответа, а не ORM объекты.
+        """
+        query = (
+            select(
+                models.Payment.id,
+                models.Subscription.title.label('subscription'),
+                models.Payment.start_date,
+                models.Payment.end_date,
+            )
+            .join(models.Subscription, models.Payment.subscription_id == models.Subscription.id)
             .where(
                 models.Payment.user_id == user_id,
                 models.Payment.is_paid,
             )
-            .offset(offset * limit)
+            .order_by(models.Payment.end_date, models.Payment.id)
             .limit(limit)
-            .order_by(models.Payment.id)
         )
-        return result.scalars().all()
+        if after is not None:
+            query = query.where(tuple_(models.Payment.end_date, models.Payment.id) > tuple_(*after))
+        else:
+            query = query.offset(offset)
+        result = await self.session.execute(query)
+        return result.all()
 
     async def create_payment(self, user_payment: schemas.UserPayment, subscription):
         db_payment = models.Payment(
@@ -120,7 +138,6 @@ class PaymentService(BaseService):
         return refund
 
 
-@lru_cache()
 def get_payment_service(
         session: AsyncSession = Depends(get_db),
         payment_system_client: EcomClient = Depends(get_client),
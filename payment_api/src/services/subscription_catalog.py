@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import asyncpg
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.future import select
+
+from models import models
+
+logger = logging.getLogger(__name__)
+
+subscription_catalog = None
+
+
+class CatalogSubscription(NamedTuple):
+    id: int
+    title: str
+    description: str
+    price: int
+    roles: List[str]
+
+
+class SubscriptionCatalog:
+    """Каталог Подписок в памяти процесса
+
+    Таблица маленькая и меняется только через админские эндпоинты, поэтому оформление
+    оплаты берет Подписку из каталога без запроса в БД. Каталог загружается целиком и
+    сбрасывается по NOTIFY, который триггер на subscriptions шлет после каждого изменения,
+    поэтому все воркеры видят правку сразу после коммита. Если уведомление потеряно или
+    LISTEN недоступен (например, за PgBouncer), каталог все равно перечитывается раз в ttl секунд.
+    """
+
+    def __init__(self, engine: AsyncEngine, dsn: str, channel: str, ttl: float):
+        self.engine = engine
+        self.dsn = dsn
+        self.channel = channel
+        self.ttl = ttl
+        self._subscriptions: Dict[str, CatalogSubscription] = {}
+        # Версия растет с каждым изменением каталога; загрузка актуальна, пока версии совпадают
+        self._version = 0
+        self._loaded_version = -1
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._connection: Optional[asyncpg.Connection] = None
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        self._version += 1
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_version == self._version and time.monotonic() - self._loaded_at < self.ttl
+
+    async def _listen(self) -> None:
+        if self._connection is not None and not self._connection.is_closed():
+            return
+        try:
+            self._connection = await asyncpg.connect(self.dsn)
+            await self._connection.add_listener(self.channel, self._on_notify)
+        except (OSError, asyncpg.PostgresError) as e:
+            logger.warning(f"Can't subscribe to subscriptions channel, catalog relies on TTL: {e!r}")
+            self._connection = None
+        # Пока не слушали канал, изменения могли пройти мимо
+        self.invalidate()
+
+    async def _load(self) -> None:
+        async with self._lock:
+            if self._is_fresh():
+                return
+            await self._listen()
+            version = self._version
+            subscription = models.Subscription
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(select(
+                    subscription.id, subscription.title, subscription.description,
+                    subscription.price, subscription.roles,
+                ))).all()
+            self._subscriptions = {
+                subscription.title: subscription for subscription in map(CatalogSubscription._make, rows)
+            }
+            # Уведомление, пришедшее во время загрузки, оставит каталог устаревшим
+            self._loaded_version = version
+            self._loaded_at = time.monotonic()
+
+    async def get(self, title: str) -> Optional[CatalogSubscription]:
+        if not self._is_fresh():
+            await self._load()
+        return self._subscriptions.get(title)
+
+    async def close(self) -> None:
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.remove_listener(self.channel, self._on_notify)
+            await self._connection.close()
+        self._connection = None
+
+
+def get_subscription_catalog() -> Optional[SubscriptionCatalog]:
+    return subscription_catalog
@@ -1,4 +1,4 @@
-from functools import lru_cache
+from typing import Optional
 
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,14 +8,19 @@ from api.v1 import schemas
 from db.postgres import get_db
 from models import models
 from services.base import BaseService
+from services.subscription_catalog import CatalogSubscription, SubscriptionCatalog, get_subscription_catalog
 
 
 class SubscriptionService(BaseService):
+    def __init__(self, session: AsyncSession, catalog: Optional[SubscriptionCatalog] = None):
+        super().__init__(session)
+        self.catalog = catalog
 
     async def create_subscription(self, subscription: schemas.SubscriptionIn):
         db_subscription = models.Subscription(**subscription.dict())
         self.session.add(db_subscription)
         await self.session.commit()
+        self._invalidate_catalog()
         await self.session.refresh(db_subscription)
         return db_subscription
 
@@ -25,6 +30,17 @@ class SubscriptionService(BaseService):
         )
         return result.scalars().first()
 
+    def _invalidate_catalog(self) -> None:
+        # Остальные воркеры узнают об изменении по NOTIFY, этот - сразу
+        if self.catalog is not None:
+            self.catalog.invalidate()
+
+    async def get_catalog_subscription(self, title) -> Optional[CatalogSubscription]:
+        """Подписка для оформления оплаты: из каталога в памяти, без запроса в БД"""
+        if self.catalog is None:
+            return await self.get_subscription_by_title(title)
+        return await self.catalog.get(title)
+
     async def change_subscription(self, subscription: schemas.SubscriptionIn, title: str):
         db_subscription = await self.get_subscription_by_title(title)
         db_subscription.title = title
@@ -33,10 +49,13 @@ class SubscriptionService(BaseService):
         db_subscription.roles = subscription.roles
         self.session.add(db_subscription)
         await self.session.commit()
+        self._invalidate_catalog()
         await self.session.refresh(db_subscription)
         return db_subscription
 
 
-@lru_cache()
-def get_subscription_service(session: AsyncSession = Depends(get_db)) -> SubscriptionService:
-    return SubscriptionService(session)
+def get_subscription_service(
+        session: AsyncSession = Depends(get_db),
+        catalog: Optional[SubscriptionCatalog] = Depends(get_subscription_catalog),
+) -> SubscriptionService:
+    return SubscriptionService(session, catalog)
@@ -1,5 +1,3 @@
-from functools import lru_cache
-
 from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -36,6 +34,5 @@ class UserService(BaseService):
         return db_user
 
 
-@lru_cache()
 def get_user_service(session: AsyncSession = Depends(get_db)) -> UserService:
     return UserService(session)
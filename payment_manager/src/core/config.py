@@ -1,3 +1,6 @@
+import os
+import socket
+
 from pydantic import BaseSettings, Field
 
 
@@ -14,6 +17,12 @@ class NotificationSettings(DotEnvMixin):
     payment_succeeded_event_name: str = Field(..., env='PAYMENT_SUCCEEDED_EVENT_NAME')
     payment_canceled_event_name: str = Field(..., env='PAYMENT_CANCELED_EVENT_NAME')
 
+    # Уведомление уходит, когда набралось max_batch_users получателей или прошло flush_interval секунд
+    max_batch_users: int = Field(500, env='NOTIFICATION_MAX_BATCH_USERS')
+    flush_interval: float = Field(1, env='NOTIFICATION_FLUSH_INTERVAL')
+    max_attempts: int = Field(3, env='NOTIFICATION_MAX_ATTEMPTS')
+    retry_delay: float = Field(0.5, env='NOTIFICATION_RETRY_DELAY')
+
     @property
     def notification_url(self):
         return f"http://{self.host}:{self.port}{self.path}"
@@ -28,6 +37,10 @@ class AuthSettings(DotEnvMixin):
     roles_path: str = Field("/auth/api/v1/users/", env='AUTH_ROLES_PATH')
     login_path: str = Field("/auth/api/v1/auth/login", env='AUTH_LOGIN_PATH')
     user_info_path: str = Field("/auth/api/v1/auth/info", env='AUTH_USER_INFO_PATH')
+    # Сколько пар Пользователь-Роль отправлять в одном bulk-запросе
+    roles_bulk_size: int = Field(500, env='AUTH_ROLES_BULK_SIZE')
+    # За сколько секунд до истечения exp обновлять access token Суперюзера
+    token_refresh_margin: float = Field(60, env='AUTH_TOKEN_REFRESH_MARGIN')
 
     @property
     def roles_url(self):
@@ -51,12 +64,67 @@ class PostgresSettings(DotEnvMixin):
     def dsn(self):
         return f'postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}'
 
+    @property
+    def asyncpg_dsn(self):
+        """DSN для прямого подключения через asyncpg (без драйвера SQLAlchemy)"""
+        return f'postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.db}'
+
+
+class ManagerSettings(DotEnvMixin):
+    """Настройки цикла обработки событий Менеджера"""
+    use_notify: bool = Field(True, env='MANAGER_USE_NOTIFY')
+    events_channel: str = Field('new_events', env='MANAGER_EVENTS_CHANNEL')
+    poll_interval: float = Field(3, env='MANAGER_POLL_INTERVAL')
+    notify_fallback_interval: float = Field(30, env='MANAGER_NOTIFY_FALLBACK_INTERVAL')
+    # Таймаут переподключения LISTEN: пока подписки нет, очередь опрашивается раз в poll_interval
+    notify_connect_timeout: float = Field(2, env='MANAGER_NOTIFY_CONNECT_TIMEOUT')
+    # Каждый экземпляр Менеджера захватывает события под своим идентификатором на lease_timeout секунд
+    worker_id: str = Field(default_factory=lambda: f"{socket.gethostname()}-{os.getpid()}", env='MANAGER_WORKER_ID')
+    batch_size: int = Field(100, env='MANAGER_BATCH_SIZE')
+    lease_timeout: float = Field(300, env='MANAGER_LEASE_TIMEOUT')
+    # Неудачное событие повторяется с экспоненциальной паузой, после max_attempts попыток уходит в dead_events
+    max_attempts: int = Field(8, env='MANAGER_MAX_ATTEMPTS')
+    retry_base_delay: float = Field(5, env='MANAGER_RETRY_BASE_DELAY')
+    retry_max_delay: float = Field(3600, env='MANAGER_RETRY_MAX_DELAY')
+    # LRU кэш Подписок: Роли меняются редко, поэтому запись живет subscription_cache_ttl секунд
+    subscription_cache_size: int = Field(256, env='MANAGER_SUBSCRIPTION_CACHE_SIZE')
+    subscription_cache_ttl: float = Field(300, env='MANAGER_SUBSCRIPTION_CACHE_TTL')
+
+    @property
+    def sleep_time(self):
+        """Пауза между опросами БД: в режиме LISTEN/NOTIFY опрос нужен только как страховка
+
+        Пока LISTEN недоступен, PostgresListener сам сокращает паузу до poll_interval.
+        """
+        return self.notify_fallback_interval if self.use_notify else self.poll_interval
+
+
+class HttpClientSettings(DotEnvMixin):
+    """Настройки пула HTTP соединений к сервисам Авторизации и Уведомлений"""
+    limit: int = Field(100, env='HTTP_POOL_LIMIT')
+    limit_per_host: int = Field(20, env='HTTP_POOL_LIMIT_PER_HOST')
+    keepalive_timeout: float = Field(30, env='HTTP_KEEPALIVE_TIMEOUT')
+    timeout: float = Field(10, env='HTTP_REQUEST_TIMEOUT')
+
+
+class MetricsSettings(DotEnvMixin):
+    """Настройки встроенного HTTP сервера с метриками Prometheus и health check"""
+    enabled: bool = Field(True, env='METRICS_ENABLED')
+    host: str = Field('0.0.0.0', env='METRICS_HOST')
+    port: int = Field(9100, env='METRICS_PORT')
+    # Как часто считать глубину очереди и через сколько секунд без итерации цикла Менеджер считается зависшим
+    queue_depth_interval: float = Field(15, env='METRICS_QUEUE_DEPTH_INTERVAL')
+    health_timeout: float = Field(300, env='METRICS_HEALTH_TIMEOUT')
+
 
 class Settings(DotEnvMixin):
     """Класс, дающий доступ к разным категориям настроек"""
     auth: AuthSettings = AuthSettings()
     postgres: PostgresSettings = PostgresSettings()
     notification: NotificationSettings = NotificationSettings()
+    manager: ManagerSettings = ManagerSettings()
+    http: HttpClientSettings = HttpClientSettings()
+    metrics: MetricsSettings = MetricsSettings()
 
 
 # Создаем объект Настроек
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresListener:
+    """Подписывается на канал Postgres (LISTEN) и будит Менеджер при появлении новых событий
+
+    Если LISTEN недоступен (PgBouncer, перезапуск БД), wait() ждет не дольше poll_interval,
+    то есть Менеджер опрашивает очередь так же часто, как без LISTEN, пока подписка не восстановится.
+    Переподключение ограничено connect_timeout секундами, чтобы не растягивать паузу опроса.
+    """
+
+    def __init__(self, dsn: str, channel: str, poll_interval: float = 3, connect_timeout: float = 2):
+        self.dsn = dsn
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.connect_timeout = connect_timeout
+        self._connection: Optional[asyncpg.Connection] = None
+        self._wakeup = asyncio.Event()
+        self._polling = False
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        """Колбэк asyncpg: пришло уведомление о новых событиях"""
+        self._wakeup.set()
+
+    def _on_termination(self, connection) -> None:
+        """Колбэк asyncpg: соединение с LISTEN оборвалось, будим Менеджер, чтобы он переподключился"""
+        self._wakeup.set()
+
+    async def connect(self) -> None:
+        """Открывает (или восстанавливает) соединение, на котором висит LISTEN"""
+        if self._connection is not None and not self._connection.is_closed():
+            return
+        self._connection = None
+        try:
+            connection = await asyncpg.connect(self.dsn, timeout=self.connect_timeout)
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+            self._fall_back_to_polling(e)
+            return
+        try:
+            await connection.add_listener(self.channel, self._on_notify)
+        except (OSError, asyncpg.PostgresError) as e:
+            await connection.close()
+            self._fall_back_to_polling(e)
+            return
+        connection.add_termination_listener(self._on_termination)
+        self._connection = connection
+        self._polling = False
+        logger.warning(f"Listening for new events on channel {self.channel}")
+
+    def _fall_back_to_polling(self, error: Exception) -> None:
+        # Переподключение пробуется на каждом ожидании, а в лог пишем только смену режима
+        if not self._polling:
+            logger.warning(f"Can't subscribe to events channel, falling back to polling every "
+                           f"{self.poll_interval}s: {error!r}")
+        self._polling = True
+
+    async def wait(self, timeout: float) -> bool:
+        """Ждет уведомления не дольше timeout секунд. Возвращает True, если уведомление пришло
+
+        Без подписки на канал ждет не дольше poll_interval секунд.
+        """
+        await self.connect()
+        if self._connection is None:
+            timeout = min(timeout, self.poll_interval)
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._wakeup.clear()
+
+    async def close(self) -> None:
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.remove_listener(self.channel, self._on_notify)
+            await self._connection.close()
+        self._connection = None
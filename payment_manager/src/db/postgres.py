@@ -12,6 +12,7 @@ async_db = async_scoped_session(
     session_factory=sessionmaker(
         autocommit=False,
         autoflush=False,
+        expire_on_commit=False,
         bind=engine,
         class_=AsyncSession,
     ),
@@ -1,9 +1,15 @@
 import logging
 import asyncio
+import signal
 
 from core.config import settings
+from db.listener import PostgresListener
+from db.postgres import engine
 from services.data_enricher import DataEnricher
+from services.http_client import HttpClient
+from services.metrics import MetricsServer
 from services.role_updater import RoleUpdater
+from services.token_provider import ServiceTokenProvider
 from services.notifier import PaymentNotifier
 from services.payment_manager import PaymentManager
 from models.models import Event
@@ -12,28 +18,95 @@ from models.models import Event
 logger = logging.getLogger(__name__)
 
 # Инициализируем компоненты и сам объект-менеджер, который будет обрабатывать оплаты
-enricher = DataEnricher()
-updater = RoleUpdater(
-    roles_url=settings.auth.roles_url,
+enricher = DataEnricher(
+    subscription_cache_size=settings.manager.subscription_cache_size,
+    subscription_cache_ttl=settings.manager.subscription_cache_ttl,
+)
+http_client = HttpClient(
+    limit=settings.http.limit,
+    limit_per_host=settings.http.limit_per_host,
+    keepalive_timeout=settings.http.keepalive_timeout,
+    timeout=settings.http.timeout,
+)
+token_provider = ServiceTokenProvider(
     login_url=settings.auth.login_url,
     superuser_email=settings.auth.superuser_email,
     superuser_pass=settings.auth.superuser_password,
+    http_client=http_client,
+    refresh_margin=settings.auth.token_refresh_margin,
+)
+updater = RoleUpdater(
+    roles_url=settings.auth.roles_url,
+    token_provider=token_provider,
+    http_client=http_client,
+    bulk_size=settings.auth.roles_bulk_size,
 )
 notifier = PaymentNotifier(
     notification_url=settings.notification.notification_url,
-    login_url=settings.auth.login_url,
-    superuser_email=settings.auth.superuser_email,
-    superuser_pass=settings.auth.superuser_password,
+    token_provider=token_provider,
+    http_client=http_client,
+    max_batch_users=settings.notification.max_batch_users,
+    flush_interval=settings.notification.flush_interval,
+    max_attempts=settings.notification.max_attempts,
+    retry_delay=settings.notification.retry_delay,
 )
+listener = PostgresListener(
+    dsn=settings.postgres.asyncpg_dsn,
+    channel=settings.manager.events_channel,
+    poll_interval=settings.manager.poll_interval,
+    connect_timeout=settings.manager.notify_connect_timeout,
+) if settings.manager.use_notify else None
 manager = PaymentManager(
     auth_updater=updater,
     enricher=enricher,
     notifier=notifier,
     payment_succeeded_event_name=settings.notification.payment_succeeded_event_name,
     payment_canceled_event_name=settings.notification.payment_canceled_event_name,
-    model_to_process=Event
+    model_to_process=Event,
+    worker_id=settings.manager.worker_id,
+    batch_size=settings.manager.batch_size,
+    lease_timeout=settings.manager.lease_timeout,
+    max_attempts=settings.manager.max_attempts,
+    retry_base_delay=settings.manager.retry_base_delay,
+    retry_max_delay=settings.manager.retry_max_delay,
+    listener=listener,
+)
+
+metrics_server = MetricsServer(
+    host=settings.metrics.host,
+    port=settings.metrics.port,
+    get_queue_depth=lambda: enricher.get_queue_depth(Event),
+    get_pool_stats=http_client.get_pool_stats,
+    get_heartbeat=lambda: manager.heartbeat,
+    health_timeout=settings.metrics.health_timeout,
+    queue_depth_interval=settings.metrics.queue_depth_interval,
 )
 
+
+async def main():
+    # По SIGTERM (rolling deploy, docker stop) Менеджер перестает захватывать события
+    # и дорабатывает текущую пачку, а затем закрывает соединения
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, manager.stop)
+
+    if settings.metrics.enabled:
+        await metrics_server.start()
+    token_provider.start()
+    notifier.start()
+    try:
+        await manager.watch_events(sleep_time=settings.manager.sleep_time)
+    finally:
+        await notifier.close()
+        await token_provider.close()
+        if listener is not None:
+            await listener.close()
+        await http_client.close()
+        await metrics_server.close()
+        await engine.dispose()
+        logger.warning("Payment Manager had been stopped")
+
+
 if __name__ == "__main__":
     logger.warning("Payment Manager had been started")
-    asyncio.run(manager.watch_events())
+    asyncio.run(main())
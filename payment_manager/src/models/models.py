@@ -15,7 +15,7 @@ class Payment(Base):
     subscription_id = sqlalchemy.Column(sqlalchemy.ForeignKey('subscriptions.id'), index=True)
     payment_url = sqlalchemy.Column(sqlalchemy.String)
     is_paid = sqlalchemy.Column(sqlalchemy.Boolean, index=True, default=False)
-    intent_id = sqlalchemy.Column(sqlalchemy.String)
+    intent_id = sqlalchemy.Column(sqlalchemy.String, unique=True, index=True)
     client_secret = sqlalchemy.Column(sqlalchemy.String)
     subscription = relationship("Subscription", back_populates="payments", uselist=False, lazy="joined")
 
@@ -34,12 +34,32 @@ class Subscription(Base):
 class Event(Base):
     __tablename__ = 'events'
 
-    payment_system_id = sqlalchemy.Column(sqlalchemy.String)
     received_at = sqlalchemy.Column(
         sqlalchemy.DateTime(timezone=True),
         primary_key=True,
         nullable=False,
         server_default=sqlalchemy.text('CURRENT_TIMESTAMP'),
     )
+    payment_system_id = sqlalchemy.Column(sqlalchemy.String, primary_key=True, nullable=False)
     data = sqlalchemy.Column(JSONB)
     processed = sqlalchemy.Column(sqlalchemy.Boolean, default=False)
+    claimed_by = sqlalchemy.Column(sqlalchemy.String)
+    claimed_until = sqlalchemy.Column(sqlalchemy.DateTime(timezone=True))
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = sqlalchemy.Column(sqlalchemy.DateTime(timezone=True))
+    last_error = sqlalchemy.Column(sqlalchemy.Text)
+
+
+class DeadEvent(Base):
+    __tablename__ = 'dead_events'
+
+    payment_system_id = sqlalchemy.Column(sqlalchemy.String, primary_key=True)
+    received_at = sqlalchemy.Column(sqlalchemy.DateTime(timezone=True), nullable=False)
+    data = sqlalchemy.Column(JSONB)
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False)
+    last_error = sqlalchemy.Column(sqlalchemy.Text)
+    failed_at = sqlalchemy.Column(
+        sqlalchemy.DateTime(timezone=True),
+        nullable=False,
+        server_default=sqlalchemy.text('CURRENT_TIMESTAMP'),
+    )
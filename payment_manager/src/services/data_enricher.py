@@ -1,43 +1,253 @@
+import datetime as dt
 import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from uuid import UUID
 
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.future import select
-from sqlalchemy import update as sqlalchemy_update
+from sqlalchemy import (
+    String, Text, and_, any_, bindparam, cast, delete, exists, func, insert, inspect, literal_column, or_, tuple_,
+    update as sqlalchemy_update,
+)
+from sqlalchemy.orm import aliased
 from db.postgres import async_db
 from models import models
 
 logger = logging.getLogger(__name__)
 
 
+class SubscriptionInfo(NamedTuple):
+    id: int
+    roles: List[str]
+
+
+class PaymentInfo(NamedTuple):
+    """Поля Оплаты, нужные Менеджеру для выдачи и отзыва Ролей"""
+    intent_id: str
+    user_id: UUID
+    end_date: dt.date
+    subscription: Optional[SubscriptionInfo]
+
+
+def payment_key(model):
+    """Платеж, к которому относится событие: payment_intent объекта, а у самого PaymentIntent - его id
+
+    Выражение совпадает с индексом ix_events_unprocessed_payment, поэтому записано текстом без параметров.
+    """
+    table = inspect(model).selectable.name
+    event_object = f"{table}.data -> 'data' -> 'object'"
+    return literal_column(f"coalesce({event_object} ->> 'payment_intent', {event_object} ->> 'id')")
+
+
 class DataEnricher:
-    """Обрабатывает и обогащает данные об успешных Оплатах"""
+    """Обрабатывает и обогащает данные об успешных Оплатах
+
+    Подписки меняются редко, поэтому их Роли кэшируются в процессе: не более
+    subscription_cache_size штук, каждая не дольше subscription_cache_ttl секунд.
+    """
+
+    def __init__(self, subscription_cache_size: int = 256, subscription_cache_ttl: float = 300):
+        self.subscription_cache_size = subscription_cache_size
+        self.subscription_cache_ttl = subscription_cache_ttl
+        self._subscriptions: OrderedDict = OrderedDict()
+
+    async def get_uncompleted_events(self, model, owner: str, limit: int, lease_timeout: float,
+                                     after: Optional[Tuple[dt.datetime, str]] = None, dead_model=None):
+        """Захватывает для воркера owner очередную страницу необработанных событий
+
+        Строки, которые прямо сейчас захватывает другой воркер, пропускаются (SKIP LOCKED),
+        а захват действует lease_timeout секунд: если воркер упал, не успев обработать
+        события, по истечении срока их заберет другой экземпляр Менеджера.
+
+        Страница берется по ключу (received_at, payment_system_id) > after (keyset): received_at
+        у событий одной пачки вебхуков может совпадать. Страница ограничена limit событий:
+        документы событий в Менеджер не передаются, поэтому строка страницы занимает немного памяти.
+        События, чья следующая попытка назначена на будущее (next_attempt_at), пропускаются.
+        Событие не захватывается, пока есть более раннее необработанное (или отложенное в
+        dead_model) событие того же платежа (см. payment_key), поэтому succeeded и refunded
+        одного платежа обрабатываются по порядку между пачками и воркерами.
+
+        Документ события целиком не передается: Postgres сам достает из JSONB тип события и
+        нужные поля его объекта, а Менеджер получает легкие строки без ORM объектов
+        (payment_system_id, received_at, attempts, last_error, type, id, customer, status, payment_intent).
+        """
+        key = tuple_(model.received_at, model.payment_system_id)
+        older = aliased(model, name='older')
+        filters = [
+            model.processed == False,
+            or_(model.claimed_until == None, model.claimed_until < func.now()),
+            or_(model.next_attempt_at == None, model.next_attempt_at <= func.now()),
+            # Событие платежа ждет, пока не обработаны более ранние события того же платежа,
+            # даже если те отложены до next_attempt_at или захвачены другим воркером
+            ~exists().where(
+                older.processed == False,
+                payment_key(older) == payment_key(model),
+                tuple_(older.received_at, older.payment_system_id) < key,
+            ),
+        ]
+        if dead_model is not None:
+            # и пока более раннее событие платежа лежит в dead_events: redrive вернет его первым
+            filters.append(~exists().where(
+                payment_key(dead_model) == payment_key(model),
+                dead_model.received_at <= model.received_at,
+            ))
+        if after is not None:
+            filters.append(key > tuple_(*after))
+        claimable = (
+            select(model.received_at, model.payment_system_id)
+            .where(*filters)
+            .order_by(model.received_at, model.payment_system_id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        event_object = model.data['data']['object']
+        query = (
+            sqlalchemy_update(model)
+            .where(key.in_(claimable))
+            .values(claimed_by=owner, claimed_until=func.now() + dt.timedelta(seconds=lease_timeout))
+            .returning(
+                model.payment_system_id,
+                model.received_at,
+                model.attempts,
+                model.last_error,
+                model.data['type'].astext.label('type'),
+                event_object['id'].astext.label('id'),
+                event_object['customer'].astext.label('customer'),
+                event_object['status'].astext.label('status'),
+                event_object['payment_intent'].astext.label('payment_intent'),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        async with async_db() as db_session:
+            result = await db_session.execute(query)
+            events = sorted(result.all(), key=lambda event: (event.received_at, event.payment_system_id))
+            await db_session.commit()
+            return events
 
-    async def get_uncompleted_events(self, model):
-        """Получаем те Оплаты, которые отмечены необработанными"""
+    async def get_queue_depth(self, model) -> int:
+        """Число необработанных событий; считается по частичному индексу очереди"""
         async with async_db() as db_session:
-            result = await db_session.execute(select(model).where(model.processed == False))
-            return result.scalars().all()
+            return await db_session.scalar(select(func.count()).select_from(model).where(model.processed == False))
+
+    async def get_payments_info(self, intent_ids: List[str]) -> Dict[str, PaymentInfo]:
+        """Одним запросом находит Оплаты всех событий пачки по payment_intent
 
-    async def get_payment_info(self, payment_id):
+        Подписки не джойнятся: их роли берутся из LRU кэша и догружаются только при промахе.
+        """
+        if not intent_ids:
+            return {}
+        payment = models.Payment
+        query = (
+            select(payment.intent_id, payment.user_id, payment.end_date, payment.subscription_id)
+            .where(payment.intent_id == any_(bindparam('intent_ids', intent_ids, type_=ARRAY(String))))
+        )
         async with async_db() as db_session:
-            result = await db_session.execute(select(models.Payment).where(models.Payment.intent_id == payment_id))
-            return result.scalars().first()
+            rows = (await db_session.execute(query)).all()
+            subscriptions = await self._get_subscriptions(db_session, {row.subscription_id for row in rows})
+        return {
+            row.intent_id: PaymentInfo(row.intent_id, row.user_id, row.end_date, subscriptions.get(row.subscription_id))
+            for row in rows
+        }
+
+    async def _get_subscriptions(self, db_session, subscription_ids: Set[int]) -> Dict[int, SubscriptionInfo]:
+        found, missing = {}, []
+        now = time.monotonic()
+        for subscription_id in subscription_ids:
+            cached = self._subscriptions.get(subscription_id)
+            if cached is not None and cached[0] > now:
+                self._subscriptions.move_to_end(subscription_id)
+                found[subscription_id] = cached[1]
+            else:
+                missing.append(subscription_id)
+        if missing:
+            subscription = models.Subscription
+            result = await db_session.execute(
+                select(subscription.id, subscription.roles).where(subscription.id.in_(missing))
+            )
+            for row in result.all():
+                found[row.id] = SubscriptionInfo(row.id, row.roles)
+                self._subscriptions[row.id] = (now + self.subscription_cache_ttl, found[row.id])
+                self._subscriptions.move_to_end(row.id)
+            while len(self._subscriptions) > self.subscription_cache_size:
+                self._subscriptions.popitem(last=False)
+        return found
+
+    async def mark_batch_as_completed(self, event_model, event_ids: List[str], payment_model,
+                                      intent_ids: List[str], owner: str, **kwargs):
+        """Одной транзакцией отмечает обработанной пачку событий и оплаченными - их Оплаты
 
-    async def mark_event_as_completed(self, model, id, **kwargs):
-        """Отмечает Оплату как успешную"""
+        Событие отмечается, только если его lease все еще принадлежит воркеру owner.
+        kwargs - значения, которые проставляются Оплатам (например, is_paid=True).
+        """
         async with async_db() as db_session:
-            query = (
-                sqlalchemy_update(model).where(model.payment_system_id == id).values(
-                    **kwargs).execution_options(synchronize_session="fetch")
+            if event_ids:
+                await db_session.execute(
+                    sqlalchemy_update(event_model)
+                    .where(
+                        event_model.payment_system_id == any_(bindparam('event_ids', event_ids, type_=ARRAY(String))),
+                        event_model.claimed_by == owner,
+                    )
+                    .values(processed=True)
+                    .execution_options(synchronize_session=False)
+                )
+            if intent_ids:
+                await db_session.execute(
+                    sqlalchemy_update(payment_model)
+                    .where(payment_model.intent_id == any_(bindparam('intent_ids', intent_ids, type_=ARRAY(String))))
+                    .values(**kwargs)
+                    .execution_options(synchronize_session=False)
+                )
+            await db_session.commit()
+
+    async def schedule_retries(self, model, retries: List[dict], owner: str):
+        """Снимает захват с событий и назначает им следующую попытку
+
+        retries - словари с ключами event_id, new_attempts, new_next_attempt_at и new_last_error
+        (имена параметров не могут совпадать с именами колонок в SET).
+        Все события обновляются одним executemany в одной транзакции.
+        """
+        if not retries:
+            return
+        query = (
+            sqlalchemy_update(model)
+            .where(and_(model.payment_system_id == bindparam('event_id'), model.claimed_by == owner))
+            .values(
+                attempts=bindparam('new_attempts'),
+                next_attempt_at=bindparam('new_next_attempt_at'),
+                last_error=bindparam('new_last_error'),
+                claimed_by=None,
+                claimed_until=None,
             )
-            await db_session.execute(query)
+            .execution_options(synchronize_session=False)
+        )
+        async with async_db() as db_session:
+            await db_session.execute(query, retries)
             await db_session.commit()
 
-    async def mark_payment_as_completed(self, model, id, **kwargs):
-        """Отмечает Оплату как успешную"""
+    async def move_to_dead_letter(self, model, dead_model, failures: List[dict], owner: str):
+        """Переносит события, исчерпавшие попытки, из очереди в dead_model
+
+        failures - словари с ключами event_id, attempts и last_error.
+        """
+        if not failures:
+            return
         async with async_db() as db_session:
-            query = (
-                sqlalchemy_update(model).where(model.intent_id == id).values(
-                    **kwargs).execution_options(synchronize_session="fetch")
-            )
-            await db_session.execute(query)
+            for failure in failures:
+                moved = (
+                    delete(model)
+                    .where(model.payment_system_id == failure['event_id'], model.claimed_by == owner)
+                    .returning(model.payment_system_id, model.received_at, model.data)
+                    .cte('moved')
+                )
+                query = insert(dead_model).from_select(
+                    ['payment_system_id', 'received_at', 'data', 'attempts', 'last_error'],
+                    select(
+                        moved.c.payment_system_id, moved.c.received_at, moved.c.data,
+                        cast(failure['attempts'], dead_model.attempts.type),
+                        cast(failure['last_error'], Text),
+                    ),
+                )
+                await db_session.execute(query)
             await db_session.commit()
@@ -1,6 +1,7 @@
 
 import logging
 from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple, Union
 
 from schemas.events import Event, PaymentEvent, PaymentIntent, RefundedCharge
 
@@ -20,40 +21,77 @@ class EcomEventParser(ABC):
         """
         pass
 
+    @abstractmethod
+    def parse_object(self, event_type: str, event_object: Mapping) -> Optional[PaymentEvent]:
+        """Parse event object already extracted from the webhook payload.
+            Args:
+                event_type: Payment system event type.
+                event_object: Mapping with the event object fields.
 
-class StripeEventParser(EcomEventParser):
-    """Handle Strike Webhook requests."""
+            Returns:
+                PaymentEvent or None for unsupported event types.
+        """
+        pass
+
+    async def parse_many(self, events: Iterable[dict]) -> List[Optional[PaymentEvent]]:
+        """Parse a batch of webhook events, keeping their order.
+
+            Returns:
+                List of parsed events, None for unsupported ones.
+        """
+        return [await self.parse(event) for event in events]
 
-    async def _parse_payment_intent(self, payment_intent: dict) -> PaymentIntent:
-        intent = PaymentIntent(
-            payment_intent=payment_intent['id'],
-            customer=payment_intent['customer'],
-            status=payment_intent['status'],
-        )
-        return intent
 
-    async def _payment_intent_succeeded(self, event_object: dict) -> PaymentIntent:
-        return await self._parse_payment_intent(event_object)
+class StripeEventParser(EcomEventParser):
+    """Handle Strike Webhook requests.
+
+    Handlers are looked up in a dispatch table built once for the class, and only the
+    fields the manager needs are copied out of the event object. The payload comes
+    from our own database and has already been validated on ingest, so models are
+    built without pydantic validation.
+    """
 
-    async def _payment_intent_canceled(self, event_object: dict) -> PaymentIntent:
-        return await self._parse_payment_intent(event_object)
+    @staticmethod
+    def _parse_payment_intent(event_object: Mapping) -> PaymentIntent:
+        return PaymentIntent.construct(
+            payment_intent=event_object['id'],
+            customer=event_object['customer'],
+            status=event_object['status'],
+        )
 
-    async def _charge_refunded(self, event_object: dict) -> RefundedCharge:
-        refunded_charge = RefundedCharge(
+    @staticmethod
+    def _parse_refunded_charge(event_object: Mapping) -> RefundedCharge:
+        return RefundedCharge.construct(
             charge_id=event_object['id'],
             payment_intent=event_object['payment_intent'],
             status=event_object['status'],
         )
-        return refunded_charge
 
-    async def parse(self, event: dict) -> PaymentEvent:
-        event_type = event['type']
-        event_object = event['data']['object']
-        logger.info('Handled event type %s', event_type)
-        try:
-            event_handler = getattr(self, f"_{Event(event_type).name}")
-        except (ValueError, AttributeError):
+    _handlers: Dict[str, Tuple[Event, Callable[[Mapping], Union[PaymentIntent, RefundedCharge]]]] = {
+        Event.payment_intent_succeeded.value: (Event.payment_intent_succeeded, _parse_payment_intent.__func__),
+        Event.payment_intent_canceled.value: (Event.payment_intent_canceled, _parse_payment_intent.__func__),
+        Event.charge_refunded.value: (Event.charge_refunded, _parse_refunded_charge.__func__),
+    }
+
+    def parse_object(self, event_type: str, event_object: Mapping) -> Optional[PaymentEvent]:
+        """Synchronous parse of an event object already extracted from the payload.
+
+        event_object may be any mapping with the object fields, e.g. a row whose
+        columns were selected from JSONB (see DataEnricher.get_uncompleted_events).
+        """
+        handler = self._handlers.get(event_type)
+        if handler is None:
             logger.warning('Unhandled event type %s', event_type)
             return None
-        event_data = await event_handler(event_object)
-        return PaymentEvent(type=event_type, data=event_data)
+        event_enum, parse_object = handler
+        return PaymentEvent.construct(type=event_enum, data=parse_object(event_object))
+
+    def parse_one(self, event: dict) -> Optional[PaymentEvent]:
+        """Synchronous parse: no awaits and no validation per field."""
+        return self.parse_object(event['type'], event['data']['object'])
+
+    async def parse(self, event: dict) -> Optional[PaymentEvent]:
+        return self.parse_one(event)
+
+    async def parse_many(self, events: Iterable[dict]) -> List[Optional[PaymentEvent]]:
+        return [self.parse_one(event) for event in events]
@@ -0,0 +1,70 @@
+import logging
+from typing import Any, NamedTuple, Optional
+
+import aiohttp
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+class HttpResponse(NamedTuple):
+    """Прочитанный ответ: тело разбирается до того, как соединение вернется в пул"""
+    status: int
+    body: Any
+
+
+class HttpClient:
+    """Долгоживущий HTTP клиент Менеджера с пулом keep-alive соединений
+
+    Один экземпляр разделяют RoleUpdater и PaymentNotifier, поэтому запросы к сервисам
+    Авторизации и Уведомлений переиспользуют уже открытые TCP соединения.
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, keepalive_timeout: float = 30,
+                 timeout: float = 10):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессия создается лениво, внутри работающего event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                json_serialize=lambda obj: orjson.dumps(obj).decode(),
+                trust_env=True,
+            )
+        return self._session
+
+    async def request(self, method: str, url: str, **kwargs) -> HttpResponse:
+        """Отправляет запрос и полностью читает ответ"""
+        async with self._get_session().request(method.upper(), url, **kwargs) as response:
+            data = await response.read()
+            try:
+                body = orjson.loads(data) if data else None
+            except orjson.JSONDecodeError:
+                body = None
+            return HttpResponse(status=response.status, body=body)
+
+    def get_pool_stats(self) -> dict:
+        """Соединения пула: занятые запросами и свободные keep-alive"""
+        if self._session is None or self._session.closed:
+            return {"in_use": 0, "idle": 0}
+        connector = self._session.connector
+        # У aiohttp нет публичного API для статистики пула
+        in_use = len(getattr(connector, '_acquired', ()))
+        idle = sum(len(conns) for conns in getattr(connector, '_conns', {}).values())
+        return {"in_use": in_use, "idle": idle}
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = Gauge('payment_manager_queue_depth', 'Unprocessed events in the queue')
+EVENT_LATENCY = Histogram(
+    'payment_manager_event_latency_seconds',
+    'Time from receiving an event to marking it processed',
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, 21600, 86400),
+)
+STAGE_DURATION = Histogram(
+    'payment_manager_stage_duration_seconds',
+    'Duration of batch processing stages',
+    ['stage'],
+)
+EVENTS = Counter('payment_manager_events_total', 'Events by processing result', ['result'])
+ERRORS = Counter('payment_manager_errors_total', 'Errors by processing stage', ['stage'])
+HTTP_POOL_CONNECTIONS = Gauge(
+    'payment_manager_http_pool_connections',
+    'Outbound HTTP pool connections by state',
+    ['state'],
+)
+
+
+class MetricsServer:
+    """Встроенный HTTP сервер Менеджера: /metrics для Prometheus и /health для оркестратора
+
+    Работает в том же event loop, что и Менеджер, поэтому отвечает, пока loop не заблокирован.
+    Глубина очереди обновляется фоновой задачей раз в queue_depth_interval секунд.
+    """
+
+    def __init__(self, host: str, port: int, get_queue_depth: Callable, get_pool_stats: Callable,
+                 get_heartbeat: Callable[[], float], health_timeout: float = 300, queue_depth_interval: float = 15):
+        self.host = host
+        self.port = port
+        self.health_timeout = health_timeout
+        self.queue_depth_interval = queue_depth_interval
+        self._get_queue_depth = get_queue_depth
+        self._get_pool_stats = get_pool_stats
+        self._get_heartbeat = get_heartbeat
+        self._runner: Optional[web.AppRunner] = None
+        self._collector: Optional[asyncio.Task] = None
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        for state, value in self._get_pool_stats().items():
+            HTTP_POOL_CONNECTIONS.labels(state).set(value)
+        response = web.Response(body=generate_latest())
+        response.content_type = CONTENT_TYPE_LATEST.split(';')[0]
+        return response
+
+    async def _health(self, request: web.Request) -> web.Response:
+        """Менеджер жив, если его цикл обработки недавно проходил очередную итерацию"""
+        since_heartbeat = time.monotonic() - self._get_heartbeat()
+        healthy = since_heartbeat < self.health_timeout
+        return web.json_response(
+            {"status": "ok" if healthy else "stalled", "since_heartbeat": round(since_heartbeat, 3)},
+            status=200 if healthy else 503,
+        )
+
+    async def _collect_queue_depth(self) -> None:
+        while True:
+            try:
+                QUEUE_DEPTH.set(await self._get_queue_depth())
+            except Exception:
+                ERRORS.labels('metrics').inc()
+                logger.exception("Can't get events queue depth")
+            await asyncio.sleep(self.queue_depth_interval)
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        app.router.add_get('/health', self._health)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._collector = asyncio.create_task(self._collect_queue_depth())
+        logger.warning(f"Metrics are served on {self.host}:{self.port}")
+
+    async def close(self) -> None:
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,56 +1,105 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional
 from uuid import UUID
 from http import HTTPStatus
 import logging
 
 import aiohttp
 
+from services.http_client import HttpClient, HttpResponse
+from services.metrics import ERRORS
+from services.token_provider import ServiceAuthError, ServiceTokenProvider, auth_headers
+
 
 logger = logging.getLogger(__name__)
 
 
 class PaymentNotifier:
-    """Отправляет сообщение с помощью сервиса Уведомлений"""
+    """Отправляет сообщение с помощью сервиса Уведомлений
+
+    Уведомления копятся по имени события и уходят одним запросом на много Пользователей:
+    когда для события набралось max_batch_users получателей, раз в flush_interval секунд
+    или по явному вызову flush(). Неудачная отправка повторяется с экспоненциальной паузой.
+    """
 
     def __init__(
             self,
             notification_url: str,
-            login_url: str,
-            superuser_email: str,
-            superuser_pass: str):
+            token_provider: ServiceTokenProvider,
+            http_client: HttpClient,
+            max_batch_users: int = 500,
+            flush_interval: float = 1,
+            max_attempts: int = 3,
+            retry_delay: float = 0.5):
         self.notification_url = notification_url
-        self.login_url = login_url
-        self.superuser_email = superuser_email
-        self.superuser_pass = superuser_pass
-        self.superuser_access_token = None
-
-    @staticmethod
-    async def _send_async_request(method: str, url: str, **kwargs):
-        """Отправляет асинхронный запрос на указанный URL"""
-        conn = aiohttp.TCPConnector(limit_per_host=5)
-        async with aiohttp.ClientSession(connector=conn, trust_env=True) as session:
-            try:
-                request_method = getattr(session, method)
-            except (ValueError, AttributeError):
-                logger.warning('Unhandled request type %s', method)
-                return
-            return await request_method(url, **kwargs)
-
-    async def _get_superuser_access_token(self) -> None:
-        """Позволяет обновить access token Суперюзера"""
-        payload = {"email": self.superuser_email, "password": self.superuser_pass}
-        response = await self._send_async_request('post', self.login_url, json=payload)
-        # Обрабатываем ответ
-        if response.status == HTTPStatus.OK:
-            # Получаем access token
-            data = await response.json()
-            access_token = data["access_token"]
-            logging.warning("Admin did login")
-
-            self.superuser_access_token = access_token
-
-            return None
-
-    async def send_notification(self, users: list[UUID], event_name: str) -> None:
-        """Позволяет отправить сообщения для Пользователей"""
+        self._token_provider = token_provider
+        self._http_client = http_client
+        self.max_batch_users = max_batch_users
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._pending: Dict[str, List[UUID]] = defaultdict(list)
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def _send_async_request(self, method: str, url: str, **kwargs) -> HttpResponse:
+        """Отправляет асинхронный запрос на указанный URL через общий пул соединений"""
+        return await self._http_client.request(method, url, **kwargs)
+
+    async def send_notification(self, users: list[UUID], event_name: str) -> bool:
+        """Позволяет отправить сообщения для Пользователей, повторяя запрос при ошибке"""
         payload = {"users": [str(user) for user in users], "event": event_name, "data": {}}
-        await self._send_async_request('post', self.notification_url, json=payload)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                token = await self._token_provider.get_token()
+                response = await self._send_async_request(
+                    'post', self.notification_url, json=payload, headers=auth_headers(token))
+                if response.status in (HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN):
+                    token = await self._token_provider.refresh(stale_token=token)
+                    response = await self._send_async_request(
+                        'post', self.notification_url, json=payload, headers=auth_headers(token))
+            except (aiohttp.ClientError, asyncio.TimeoutError, ServiceAuthError) as e:
+                logger.warning(f"Notification {event_name} failed: {e!r}")
+                continue
+            if response.status < HTTPStatus.MULTIPLE_CHOICES:
+                return True
+            logger.warning(f"Notification {event_name} failed with HTTP {response.status}")
+        ERRORS.labels('notify').inc()
+        logger.error(f"Notification {event_name} for {len(users)} users dropped after {self.max_attempts} attempts")
+        return False
+
+    async def add_notification(self, users: list[UUID], event_name: str) -> None:
+        """Ставит уведомление в очередь; набрав max_batch_users получателей, сразу отправляет их"""
+        self._pending[event_name].extend(users)
+        if len(self._pending[event_name]) >= self.max_batch_users:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Отправляет все накопленные уведомления пачками по max_batch_users получателей"""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, defaultdict(list)
+            for event_name, users in pending.items():
+                # Один Пользователь получает одно уведомление о событии на всю пачку
+                users = list(dict.fromkeys(users))
+                for start in range(0, len(users), self.max_batch_users):
+                    await self.send_notification(users[start:start + self.max_batch_users], event_name)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """Запускает фоновую отправку накопленных уведомлений раз в flush_interval секунд"""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def close(self) -> None:
+        """Останавливает фоновую отправку и отправляет все, что осталось"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
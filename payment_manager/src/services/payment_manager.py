@@ -1,24 +1,35 @@
+import asyncio
 import datetime as dt
-import time
 import logging
+import random
+import time
+from typing import Dict, List, Optional
 from uuid import UUID
 
-from services.role_updater import RoleUpdater
-from services.data_enricher import DataEnricher
+from db.listener import PostgresListener
+from services.role_updater import RoleChanges, RoleUpdater
+from services.data_enricher import DataEnricher, PaymentInfo
 from services.notifier import PaymentNotifier
 from services.ecom_parser import StripeEventParser
-from typing import List
+from services.metrics import ERRORS, EVENT_LATENCY, EVENTS, STAGE_DURATION
 
 from models import models
 
 logger = logging.getLogger(__name__)
 
 
+class EventProcessingError(Exception):
+    """Событие нельзя обработать сейчас: оно будет повторено позже или уйдет в dead_events"""
+
+
 class PaymentManager:
     """Управляет обработкой успешной транзакции и взаимодействует с другими сервисами"""
 
     def __init__(self, auth_updater: RoleUpdater, enricher: DataEnricher, notifier: PaymentNotifier, model_to_process,
-                 payment_succeeded_event_name: str, payment_canceled_event_name: str):
+                 payment_succeeded_event_name: str, payment_canceled_event_name: str,
+                 worker_id: str, batch_size: int = 100, lease_timeout: float = 300, max_attempts: int = 8,
+                 retry_base_delay: float = 5, retry_max_delay: float = 3600,
+                 listener: Optional[PostgresListener] = None):
         self._auth_updater = auth_updater
         self._notifier = notifier
         self.payment_succeeded_event_name = payment_succeeded_event_name
@@ -26,38 +37,240 @@ class PaymentManager:
         self._enricher = enricher
         self._model_to_process = model_to_process
         self.event_parser = StripeEventParser()
+        self._listener = listener
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        # Сколько пачек подряд не удалось отправить в Авторизацию: от этого зависит пауза
+        self._auth_failures = 0
+        self._stopping = asyncio.Event()
+        # Время последней итерации цикла обработки, по нему /health понимает, что Менеджер не завис
+        self.heartbeat = time.monotonic()
+
+    def stop(self) -> None:
+        """Просит Менеджер остановиться: новые события больше не захватываются, текущая пачка дорабатывается"""
+        if not self._stopping.is_set():
+            logger.warning("Payment Manager is stopping")
+        self._stopping.set()
+
+    async def watch_events(self, sleep_time: float = 3) -> None:
+        """Мониторит новые необработанные записи в БД
+
+        Если передан listener, Менеджер просыпается по NOTIFY от БД, а sleep_time служит
+        только страховочным интервалом опроса на случай потерянного уведомления.
+        Цикл завершается после stop(), как только обработана пачка, взятая в работу.
+        """
+        after = None
+        while not self._stopping.is_set():
+            self.heartbeat = time.monotonic()
+            try:
+                with STAGE_DURATION.labels('claim').time():
+                    events = await self._enricher.get_uncompleted_events(
+                        models.Event,
+                        owner=self.worker_id,
+                        limit=self.batch_size,
+                        lease_timeout=self.lease_timeout,
+                        after=after,
+                        dead_model=models.DeadEvent,
+                    )
+                backoff = await self._process_batch(events) if events else None
+            except Exception:
+                # Сбой БД не должен останавливать Менеджер: захваченные события вернутся по истечении lease
+                ERRORS.labels('batch').inc()
+                logger.exception("Failed to process a batch of events")
+                after = None
+                await self._sleep(sleep_time)
+                continue
+            if backoff:
+                # Авторизация недоступна: не перебираем очередь впустую, отложенные события вернутся сами
+                after = None
+                await self._sleep(min(backoff, sleep_time))
+            elif events:
+                # Пока очередь не пуста, листаем ее дальше без паузы
+                after = (events[-1].received_at, events[-1].payment_system_id)
+            elif after is not None:
+                # Дошли до конца очереди: еще раз с начала, чтобы подобрать события с истекшим lease
+                after = None
+            else:
+                await self._wait_for_new_events(sleep_time)
+
+    async def _process_batch(self, events: list) -> Optional[float]:
+        """Обрабатывает пачку событий
+
+        Обработка события не ходит в сеть: Оплаты всей пачки загружаются одним запросом, а изменения
+        Ролей и уведомления копятся и отправляются в конце, поэтому события разбираются простым циклом.
+        Порядок событий одного платежа гарантирует захват: в пачку попадает только самое раннее
+        необработанное событие платежа (см. DataEnricher.get_uncompleted_events).
+        Изменения Ролей всей пачки уходят в сервис Авторизации несколькими bulk-запросами,
+        после чего успешно обработанные события и их Оплаты отмечаются в БД одной транзакцией.
+        Если Авторизация отклонила часть пар, откладываются только затронувшие их события.
+        Неудачные события откладываются с экспоненциальной паузой (см. _handle_failures).
+        Если Авторизация недоступна целиком, события с изменениями Ролей откладываются без
+        увеличения счетчика попыток, а метод возвращает паузу, которую стоит выдержать циклу.
+        """
+        changes = RoleChanges()
+        notifications = []
+        logger.warning(f"There are {len(events)} uncompleted events")
+        with STAGE_DURATION.labels('parse').time():
+            # Поля объекта события уже извлечены из JSONB запросом захвата
+            parsed = [(event, self.event_parser.parse_object(event.type, event._mapping)) for event in events]
+        completed, failures = [], []
+        with STAGE_DURATION.labels('enrich').time():
+            # Оплаты всех событий пачки загружаются одним запросом
+            payments = await self._enricher.get_payments_info(
+                list({event_data.data.payment_intent for _, event_data in parsed if event_data is not None})
+            )
+            for event, event_data in parsed:
+                try:
+                    completed.append((event, self.process_event(event, event_data, payments, changes, notifications)))
+                except Exception as e:
+                    ERRORS.labels('process').inc()
+                    logger.exception(f"Failed to process event {event.payment_system_id}")
+                    failures.append((event, repr(e)))
+        try:
+            with STAGE_DURATION.labels('auth').time():
+                rejected = await self._auth_updater.apply(changes)
+        except Exception as e:
+            # Сбой Авторизации - не вина событий: попытку не засчитываем, иначе за время простоя
+            # вся очередь ушла бы в dead_events. События без изменений Ролей завершаются как обычно
+            ERRORS.labels('auth').inc()
+            logger.exception("Failed to update roles for a batch of events")
+            self._auth_failures += 1
+            backoff = self._get_retry_delay(self._auth_failures)
+            waiting = changes.get_event_ids()
+            await self._postpone(
+                [event for event, _ in completed if event.payment_system_id in waiting], repr(e), backoff
+            )
+            completed = [item for item in completed if item[0].payment_system_id not in waiting]
+            notifications = [item for item in notifications if item[0] not in waiting]
+            rejected = set()
+        else:
+            backoff = None
+            self._auth_failures = 0
+        if rejected:
+            # Откладываются только события с отклоненными парами, остальные изменения уже применены
+            ERRORS.labels('auth').inc()
+            rejected_events = changes.get_event_ids(rejected)
+            pairs = ", ".join(f"{user}/{role}" for user, role in sorted(rejected, key=str))
+            error = repr(EventProcessingError(f"Auth service rejected roles: {pairs}"))
+            failures.extend((event, error) for event, _ in completed if event.payment_system_id in rejected_events)
+            completed = [item for item in completed if item[0].payment_system_id not in rejected_events]
+            notifications = [item for item in notifications if item[0] not in rejected_events]
+        await self._handle_failures(failures)
+        with STAGE_DURATION.labels('notify').time():
+            # Уведомления отправляет PaymentNotifier по порогу размера или времени, объединяя пачки
+            for _, user_id, event_name in notifications:
+                await self._notifier.add_notification([user_id], event_name)
+
+        event_ids = [event.payment_system_id for event, _ in completed]
+        intent_ids = list({intent_id for _, intent_id in completed if intent_id})
+        with STAGE_DURATION.labels('mark').time():
+            await self.mark_batch_as_completed(event_ids, intent_ids)
+        now = dt.datetime.now(dt.timezone.utc)
+        for event, _ in completed:
+            EVENT_LATENCY.observe((now - event.received_at).total_seconds())
+        EVENTS.labels('completed').inc(len(completed))
+        return backoff
+
+    def _get_retry_delay(self, attempts: int) -> float:
+        """Экспоненциальная пауза перед попыткой attempts + 1 со случайным разбросом в половину паузы
+
+        Разброс не дает событиям, упавшим вместе (например, из-за недоступности Авторизации),
+        вернуться в очередь одновременно.
+        """
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+    async def _postpone(self, events: list, error: str, delay: float) -> None:
+        """Снимает захват с событий и возвращает их в очередь через delay секунд, не тратя попытку"""
+        next_attempt_at = dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=delay)
+        await self._enricher.schedule_retries(models.Event, [{
+            "event_id": event.payment_system_id, "new_attempts": event.attempts,
+            "new_next_attempt_at": next_attempt_at, "new_last_error": error,
+        } for event in events], owner=self.worker_id)
+        EVENTS.labels('postponed').inc(len(events))
+
+    async def _handle_failures(self, failures: List[tuple]) -> None:
+        """Откладывает упавшие события или переносит в dead_events исчерпавшие max_attempts попыток
+
+        failures - пары (событие, ошибка). Более поздние события того же платежа не захватываются,
+        пока упавшее не обработано, поэтому порядок событий платежа сохраняется.
+        """
+        retries, dead = [], []
+        now = dt.datetime.now(dt.timezone.utc)
+        for event, error in failures:
+            attempts = event.attempts + 1
+            if attempts >= self.max_attempts:
+                logger.error(f"Event {event.payment_system_id} moved to dead letter after {attempts} attempts")
+                dead.append({"event_id": event.payment_system_id, "attempts": attempts, "last_error": error})
+            else:
+                retries.append({
+                    "event_id": event.payment_system_id, "new_attempts": attempts,
+                    "new_next_attempt_at": now + dt.timedelta(seconds=self._get_retry_delay(attempts)),
+                    "new_last_error": error,
+                })
+        await self._enricher.schedule_retries(models.Event, retries, owner=self.worker_id)
+        await self._enricher.move_to_dead_letter(models.Event, models.DeadEvent, dead, owner=self.worker_id)
+        EVENTS.labels('retried').inc(len(failures) - len(dead))
+        EVENTS.labels('dead').inc(len(dead))
+
+    def process_event(self, event, event_data, payments: Dict[str, PaymentInfo], changes: RoleChanges,
+                      notifications: list) -> Optional[str]:
+        """Определяет, какие Роли выдать или отозвать по событию и кого уведомить
+
+        Изменения Ролей копятся в changes, уведомления (id события, Пользователь, имя события) -
+        в notifications, а отправляются они для всей пачки сразу. Возвращает payment_intent Оплаты,
+        которую нужно отметить оплаченной.
+        """
+        if not event_data:
+            return None
+        payment = payments.get(event_data.data.payment_intent)
+        if payment is None:
+            raise EventProcessingError(f"Payment {event_data.data.payment_intent} not found")
+        if payment.subscription is None:
+            raise EventProcessingError(f"Payment {payment.intent_id} has no subscription")
+        if event_data.type.name == 'payment_intent_succeeded':
+            changes.add_roles(
+                [payment.user_id], payment.subscription.roles, str(payment.end_date),
+                event.received_at, event.payment_system_id,
+            )
+            notifications.append((event.payment_system_id, payment.user_id, self.payment_succeeded_event_name))
+        elif event_data.type.name == 'charge_refunded':
+            changes.delete_roles(
+                [payment.user_id], payment.subscription.roles,
+                str(dt.datetime.now().date()), event.received_at, event.payment_system_id,
+            )
+            notifications.append((event.payment_system_id, payment.user_id, self.payment_canceled_event_name))
+        return payment.intent_id
+
+    async def _sleep(self, timeout: float) -> None:
+        """Пауза, которую прерывает stop()"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _wait_for_new_events(self, sleep_time: float) -> None:
+        """Не блокируя event loop, ждет уведомления о новых событиях, stop() или истечения sleep_time"""
+        if self._listener is None:
+            await self._sleep(sleep_time)
+            return
+        stopping = asyncio.create_task(self._stopping.wait())
+        notified = asyncio.create_task(self._listener.wait(timeout=sleep_time))
+        try:
+            await asyncio.wait((stopping, notified), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stopping.cancel()
+            notified.cancel()
 
-    async def watch_events(self, sleep_time: int = 3) -> None:
-        """Мониторит новые необработанные записи в БД"""
-        while True:
-            events = await self._enricher.get_uncompleted_events(models.Event)
-            if events:
-                for event in events:
-                    logger.warning(f"There are uncompleted event: {event.payment_system_id}")
-                    event_data = await self.event_parser.parse(event.data)
-                    if not event_data:
-                        await self.mark_event_as_completed(event.payment_system_id)
-                    else:
-                        payment = await self._enricher.get_payment_info(event_data.data.payment_intent)
-                        if event_data.type.name == 'payment_intent_succeeded':
-                            await self._auth_updater.add_roles([payment.user_id], payment.subscription.roles, str(payment.end_date))
-                            await self._notifier.send_notification([payment.user_id], self.payment_succeeded_event_name)
-                        elif event_data.type.name == 'charge_refunded':
-                            await self._auth_updater.delete_roles(
-                                [payment.user_id], payment.subscription.roles,
-                                str(dt.datetime.now().date())
-                            )
-                            await self._notifier.send_notification([payment.user_id], self.payment_canceled_event_name)
-                        await self.mark_event_as_completed(event.payment_system_id)
-                        await self.mark_payment_as_paid(payment.intent_id)
-            time.sleep(sleep_time)
-
-    async def mark_event_as_completed(self, id: str) -> None:
-        """Помечает Оплату как завершенную"""
-        await self._enricher.mark_event_as_completed(models.Event, id, processed=True)
-        logger.warning(f"Payment Management Completed an event {id}")
-
-    async def mark_payment_as_paid(self, id: str) -> None:
-        """Помечает Оплату как завершенную"""
-        await self._enricher.mark_payment_as_completed(model=models.Payment, id=id, is_paid=True)
-        logger.warning(f"Payment Management Completed on payment {id}")
+    async def mark_batch_as_completed(self, event_ids: List[str], intent_ids: List[str]) -> None:
+        """Помечает пачку событий обработанной, а их Оплаты - оплаченными"""
+        if not event_ids:
+            return
+        await self._enricher.mark_batch_as_completed(
+            models.Event, event_ids, models.Payment, intent_ids, owner=self.worker_id, is_paid=True,
+        )
+        logger.warning(f"Payment Management Completed {len(event_ids)} events and {len(intent_ids)} payments")
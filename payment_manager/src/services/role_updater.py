@@ -1,9 +1,11 @@
-from typing import List
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
 from uuid import UUID
 from http import HTTPStatus
 import logging
 
-import aiohttp
+from services.http_client import HttpClient, HttpResponse
+from services.token_provider import ServiceTokenProvider, auth_headers
 
 
 logger = logging.getLogger(__name__)
@@ -12,71 +14,98 @@ logger = logging.getLogger(__name__)
 class RoleUpdater:
     """Добавляет роли Пользователя, используя удаленный сервис Авторизации"""
 
-    def __init__(self, roles_url: str, login_url: str, superuser_email: str, superuser_pass: str):
+    def __init__(self, roles_url: str, token_provider: ServiceTokenProvider, http_client: HttpClient,
+                 bulk_size: int = 500):
         self.roles_url = roles_url
-        self.login_url = login_url
-        self.superuser_email = superuser_email
-        self.superuser_pass = superuser_pass
-        self.superuser_access_token = None
-
-    @staticmethod
-    async def _send_async_request(method: str, url: str, **kwargs):
-        """Отправляет асинхронный запрос на указанный URL"""
-        conn = aiohttp.TCPConnector(limit_per_host=5)
-        async with aiohttp.ClientSession(connector=conn, trust_env=True) as session:
-            try:
-                request_method = getattr(session, method)
-            except (ValueError, AttributeError):
-                logger.warning('Unhandled request type %s', method)
-                return
-            return await request_method(url, **kwargs)
-
-    async def _get_superuser_access_token(self) -> None:
-        """Позволяет обновить access token Суперюзера"""
-        payload = {"email": self.superuser_email, "password": self.superuser_pass}
-        response = await self._send_async_request('post', self.login_url, json=payload)
-        # Обрабатываем ответ
-        if response.status == HTTPStatus.OK:
-            # Получаем access token
-            data = await response.json()
-            access_token = data["access_token"]
-            logging.warning("Admin did login")
-
-            self.superuser_access_token = access_token
-
-            return None
-
-    async def add_roles(self, users: List[UUID], roles: List[str], expired_at: str) -> None:
-        """Позволяет разом добавить Роли списку Пользователей"""
-        # Для каждого Пользователя и для каждой Роли:
-        for user in users:
-            for role in roles:
-                url = f"{self.roles_url}/{user}/roles"
-                # Если мы не запрашивали access token, то следует запросить
-                if not self.superuser_access_token:
-                    await self._get_superuser_access_token()
-                # Формируем данные для запроса
-                headers = {"Authorization": f"Bearer {self.superuser_access_token}"}
-                payload = {"name": role, "date": expired_at}
-                # Отправляем запрос
-                response = await self._send_async_request('post', url, json=payload, headers=headers)
-                logger.warning(f"HTTP Response: {response}")
-                # Если Access Token потерял актуальность, то обновляем его и переотправляем запрос
-                if response.status == HTTPStatus.FORBIDDEN:
-                    await self._get_superuser_access_token()
-                    await self._send_async_request('post', url, json=payload, headers=headers)
-
-    async def delete_roles(self, users: List[UUID], roles: List[str], expired_at: str) -> None:
-        """Позволяет разом удалить Роли списку Пользователей"""
+        self.bulk_roles_url = f"{roles_url.rstrip('/')}/roles"
+        self.bulk_size = bulk_size
+        self._token_provider = token_provider
+        self._http_client = http_client
+
+    async def _send_async_request(self, method: str, url: str, **kwargs) -> HttpResponse:
+        """Отправляет асинхронный запрос на указанный URL через общий пул соединений"""
+        return await self._http_client.request(method, url, **kwargs)
+
+    async def _send_with_token(self, method: str, url: str, payload: dict) -> HttpResponse:
+        """Отправляет запрос от имени Суперюзера, при необходимости перелогинившись"""
+        token = await self._token_provider.get_token()
+        response = await self._send_async_request(method, url, json=payload, headers=auth_headers(token))
+        # Токен могли отозвать раньше exp: обновляем его один раз на все задачи и переотправляем запрос
+        if response.status in (HTTPStatus.UNAUTHORIZED, HTTPStatus.FORBIDDEN):
+            token = await self._token_provider.refresh(stale_token=token)
+            response = await self._send_async_request(method, url, json=payload, headers=auth_headers(token))
+        logger.warning(f"HTTP Response: {response.status}")
+        if response.status != HTTPStatus.OK:
+            raise RoleUpdateError(f"Auth service responded {response.status} on {method} {url}: {response.body}")
+        return response
+
+    async def apply(self, changes: "RoleChanges") -> Set[Tuple[UUID, str]]:
+        """Отправляет накопленные за пачку изменения Ролей bulk-запросами по bulk_size пар
+
+        Сервис Авторизации применяет допустимые пары и возвращает отклоненные (неизвестный
+        Пользователь или Роль). Возвращает множество отклоненных пар (Пользователь, Роль).
+        """
+        rejected = set()
+        for method, action in (('post', RoleChanges.ADD), ('delete', RoleChanges.DELETE)):
+            items = changes.get_items(action)
+            for start in range(0, len(items), self.bulk_size):
+                response = await self._send_with_token(
+                    method, self.bulk_roles_url, {"items": items[start:start + self.bulk_size]}
+                )
+                for item in (response.body or {}).get("rejected", []):
+                    logger.warning(f"Auth service rejected role {item['name']} of user {item['user_id']}: "
+                                   f"{item.get('reason')}")
+                    rejected.add((UUID(item["user_id"]), item["name"]))
+        return rejected
+
+
+class RoleUpdateError(Exception):
+    """Сервис Авторизации не применил изменения Ролей"""
+
+
+class RoleChanges:
+    """Копит выдачи и отзывы Ролей за пачку событий, чтобы отправить их несколькими запросами
+
+    Для каждой пары Пользователь-Роль остается только действие самого позднего события,
+    поэтому итог не зависит от порядка событий разных платежей в пачке.
+    """
+    ADD = 'add'
+    DELETE = 'delete'
+
+    def __init__(self):
+        self._changes: Dict[Tuple[UUID, str], Tuple[datetime, str, str]] = {}
+        # События, затронувшие пару: если Авторизация отклонит пару, повторять нужно их все
+        self._events: Dict[Tuple[UUID, str], Set[str]] = {}
+
+    def _set(self, action: str, users: List[UUID], roles: List[str], expired_at: str, happened_at: datetime,
+             event_id: str) -> None:
         for user in users:
             for role in roles:
-                url = f"{self.roles_url}/{user}/roles"
-                if not self.superuser_access_token:
-                    await self._get_superuser_access_token()
-                headers = {"Authorization": f"Bearer {self.superuser_access_token}"}
-                payload = {"name": role, "date": expired_at}
-                response = await self._send_async_request('delete', url, json=payload, headers=headers)
-                logger.warning(f"HTTP Response: {response}")
-                if response.status == HTTPStatus.FORBIDDEN:
-                    await self._get_superuser_access_token()
-                    await self._send_async_request('delete', url, json=payload, headers=headers)
+                current = self._changes.get((user, role))
+                if current is None or current[0] <= happened_at:
+                    self._changes[(user, role)] = (happened_at, action, expired_at)
+                self._events.setdefault((user, role), set()).add(event_id)
+
+    def add_roles(self, users: List[UUID], roles: List[str], expired_at: str, happened_at: datetime,
+                  event_id: str) -> None:
+        """Запоминает выдачу Ролей списку Пользователей по событию event_id"""
+        self._set(self.ADD, users, roles, expired_at, happened_at, event_id)
+
+    def delete_roles(self, users: List[UUID], roles: List[str], expired_at: str, happened_at: datetime,
+                     event_id: str) -> None:
+        """Запоминает отзыв Ролей у списка Пользователей по событию event_id"""
+        self._set(self.DELETE, users, roles, expired_at, happened_at, event_id)
+
+    def get_event_ids(self, pairs: Optional[Set[Tuple[UUID, str]]] = None) -> Set[str]:
+        """id событий, которые затронули хотя бы одну из пар (Пользователь, Роль); без pairs - любую пару"""
+        if pairs is None:
+            pairs = self._events.keys()
+        return {event_id for pair in pairs for event_id in self._events.get(pair, ())}
+
+    def get_items(self, action: str) -> List[dict]:
+        """Элементы bulk-запроса к сервису Авторизации для действия action"""
+        return [
+            {"user_id": str(user), "name": role, "date": expired_at}
+            for (user, role), (_, change, expired_at) in self._changes.items()
+            if change == action
+        ]
@@ -0,0 +1,110 @@
+import asyncio
+import base64
+import logging
+import time
+from http import HTTPStatus
+from typing import Optional
+
+import orjson
+
+from services.http_client import HttpClient
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceAuthError(Exception):
+    """Не удалось получить access token Суперюзера"""
+
+
+def auth_headers(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def get_token_expiration(token: str) -> Optional[float]:
+    """Достает exp (unix time) из payload JWT без проверки подписи: токен выдал наш же сервис Авторизации"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(orjson.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, KeyError, TypeError, ValueError, orjson.JSONDecodeError):
+        return None
+
+
+class ServiceTokenProvider:
+    """Общий для RoleUpdater и PaymentNotifier access token Суперюзера
+
+    Токен обновляется в фоне за refresh_margin секунд до истечения exp, поэтому запросы
+    не получают 403 из-за протухшего токена. Одновременные обновления объединяются в один
+    логин: пока он идет, остальные задачи ждут его результата.
+    """
+
+    def __init__(self, login_url: str, superuser_email: str, superuser_pass: str, http_client: HttpClient,
+                 refresh_margin: float = 60, retry_delay: float = 5):
+        self.login_url = login_url
+        self.superuser_email = superuser_email
+        self.superuser_pass = superuser_pass
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self._http_client = http_client
+        self._token: Optional[str] = None
+        self._refresh_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
+
+    def _is_fresh(self) -> bool:
+        if self._token is None:
+            return False
+        # Если exp в токене нет, считаем его бессрочным до первого 401/403
+        return self._refresh_at is None or time.time() < self._refresh_at
+
+    async def _login(self) -> None:
+        payload = {"email": self.superuser_email, "password": self.superuser_pass}
+        response = await self._http_client.request('post', self.login_url, json=payload)
+        if response.status != HTTPStatus.OK or not response.body or "access_token" not in response.body:
+            raise ServiceAuthError(f"Auth service responded {response.status} on login")
+        self._token = response.body["access_token"]
+        expires_at = get_token_expiration(self._token)
+        if expires_at is None:
+            self._refresh_at = None
+        else:
+            # Короткоживущий токен обновляем не раньше половины его срока, иначе логин шел бы на каждый запрос
+            now = time.time()
+            self._refresh_at = expires_at - min(self.refresh_margin, (expires_at - now) / 2)
+        logger.warning("Admin did login")
+
+    async def refresh(self, stale_token: Optional[str] = None) -> str:
+        """Получает новый токен; stale_token - токен, который отвергли, его повторно не выдаем"""
+        async with self._lock:
+            # Пока ждали блокировку, токен мог обновить кто-то другой
+            if self._token != stale_token and self._is_fresh():
+                return self._token
+            await self._login()
+            return self._token
+
+    async def get_token(self) -> str:
+        """Актуальный токен; логинится, только если токена нет или он скоро истечет"""
+        if self._is_fresh():
+            return self._token
+        return await self.refresh(stale_token=self._token)
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            try:
+                await self.get_token()
+                if self._refresh_at is None:
+                    return
+                delay = self._refresh_at - time.time()
+            except Exception:
+                logger.exception("Can't refresh service token")
+                delay = self.retry_delay
+            await asyncio.sleep(max(delay, 0))
+
+    def start(self) -> None:
+        """Запускает фоновое обновление токена до истечения его срока"""
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_periodically())
+
+    async def close(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
@@ -1,3 +1,4 @@
 #!/bin/bash
 
-python3 src/main.py
\ No newline at end of file
+# exec: SIGTERM от docker должен дойти до Менеджера, а не до bash
+exec python3 src/main.py
\ No newline at end of file
@@ -1,6 +1,11 @@
 import asyncio
+import hashlib
+import hmac
+import json
+import time
 
 import aiohttp
+import asyncpg
 import pytest
 import pytest_asyncio
 
@@ -24,15 +29,29 @@ async def session():
     await session.close()
 
 
+@pytest_asyncio.fixture(scope='session')
+async def pg_connection():
+    """Соединение с БД сервиса: для данных, которые нельзя создать через API"""
+    connection = await asyncpg.connect(
+        user=test_settings.postgres_user,
+        password=test_settings.postgres_password,
+        host=test_settings.postgres_host,
+        port=test_settings.postgres_port,
+        database=test_settings.postgres_db,
+    )
+    yield connection
+    await connection.close()
+
+
 @pytest_asyncio.fixture
 def make_get_request(session):
     """Фикстура для отправки GET запросов.
     """
 
-    async def inner(endpoint: str, params: dict | None = None) -> HTTPResponse:
+    async def inner(endpoint: str, params: dict | None = None, headers: dict | None = None) -> HTTPResponse:
         params = params or {}
         url = f'{FASTAPI_URL}{endpoint}'
-        async with session.get(url, params=params) as response:
+        async with session.get(url, params=params, headers=headers) as response:
             return HTTPResponse(
                 body=await response.json(),
                 headers=response.headers,
@@ -78,3 +97,28 @@ def make_patch_request(session):
             )
 
     return inner
+
+
+@pytest_asyncio.fixture
+def make_webhook_request(session):
+    """Фикстура для отправки вебхука, подписанного так же, как его подписывает Stripe.
+    """
+
+    async def inner(event: dict) -> HTTPResponse:
+        payload = json.dumps(event).encode()
+        timestamp = int(time.time())
+        signature = hmac.new(
+            test_settings.stripe_endpoint_secret.encode(),
+            f'{timestamp}.'.encode() + payload,
+            hashlib.sha256,
+        ).hexdigest()
+        headers = {'Content-Type': 'application/json', 'Stripe-Signature': f't={timestamp},v1={signature}'}
+        url = f'{FASTAPI_URL}{test_settings.webhook_router_prefix}'
+        async with session.post(url, data=payload, headers=headers) as response:
+            return HTTPResponse(
+                body=await response.json(),
+                headers=response.headers,
+                status=response.status,
+            )
+
+    return inner
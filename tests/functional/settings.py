@@ -5,8 +5,18 @@ class TestSettings(BaseSettings):
     fastapi_host: str = 'http://127.0.0.1'
     fastapi_port: str = '8888'
 
+    postgres_user: str = 'postgres'
+    postgres_password: str = 'password'
+    postgres_host: str = '127.0.0.1'
+    postgres_port: int = 5432
+    postgres_db: str = 'payments'
+
     subscriptions_router_prefix: str = '/api/v1/subscriptions/'
     payments_router_prefix: str = '/api/v1/payments/'
+    webhook_router_prefix: str = '/api/v1/webhook/'
+
+    # Тот же секрет, что у payment_api: им подписываются тестовые вебхуки
+    stripe_endpoint_secret: str = 'pk_test_51M2zGaEUp1F2G8nCjwz4CIQDmbYMnwQov5GiD4fUbGq0WPN4BMXXrSPOI3GvcFdibmskQTG8UMswD2Yp4iSqWNwK00aCATDahk'
 
 
 test_settings = TestSettings()
@@ -1,6 +1,9 @@
+import asyncio
+import datetime
 from http import HTTPStatus
 
 import pytest
+import pytest_asyncio
 
 import testdata.data
 from settings import test_settings
@@ -27,3 +30,85 @@ async def test_add_payment_by_user(make_post_request):
         headers=headers
     )
     assert response.status == HTTPStatus.OK
+
+
+async def test_concurrent_requests_use_own_sessions(make_get_request):
+    # Каждый запрос получает собственную сессию БД: общая сессия на параллельных запросах
+    # падает с "another operation is in progress" и отдает 500
+    responses = await asyncio.gather(*(
+        make_get_request(
+            endpoint=f'{test_settings.payments_router_prefix}',
+            headers={f'Authorization': f'Bearer {testdata.data.user_token}'},
+        )
+        for _ in range(50)
+    ))
+    assert {response.status for response in responses} == {HTTPStatus.OK}
+    assert all(response.body == responses[0].body for response in responses)
+
+
+async def test_paid_payments_invalid_cursor(make_get_request):
+    response = await make_get_request(
+        endpoint=f'{test_settings.payments_router_prefix}',
+        params={'page[after]': 'not-a-cursor'},
+        headers={f'Authorization': f'Bearer {testdata.data.user_token}'},
+    )
+    assert response.status == HTTPStatus.BAD_REQUEST
+
+
+@pytest_asyncio.fixture
+async def paid_payments(pg_connection):
+    """Оплаченные платежи тестового пользователя; два из них заканчиваются в один день"""
+    await pg_connection.execute(
+        'INSERT INTO users (id, is_recurrent_payments) VALUES ($1, false) ON CONFLICT DO NOTHING',
+        testdata.data.user_id,
+    )
+    subscription_id = await pg_connection.fetchval(
+        """
+        INSERT INTO subscriptions (title, description, price, roles) VALUES ('keyset', 'keyset', 100, '{}')
+        ON CONFLICT (title) DO UPDATE SET title = excluded.title RETURNING id
+        """
+    )
+    end_dates = [datetime.date(2030, 1, day) for day in (1, 2, 2, 3, 4)]
+    payment_ids = [
+        await pg_connection.fetchval(
+            """
+            INSERT INTO payments (user_id, start_date, end_date, subscription_id, is_paid)
+            VALUES ($1, $2, $3, $4, true) RETURNING id
+            """,
+            testdata.data.user_id, end_date - datetime.timedelta(days=30 + number), end_date, subscription_id,
+        )
+        for number, end_date in enumerate(end_dates)
+    ]
+    yield payment_ids
+    await pg_connection.execute('DELETE FROM payments WHERE id = ANY($1::int[])', payment_ids)
+
+
+async def test_paid_payments_keyset_pagination(make_get_request, paid_payments):
+    headers = {f'Authorization': f'Bearer {testdata.data.user_token}'}
+    response = await make_get_request(
+        endpoint=f'{test_settings.payments_router_prefix}',
+        params={'page[size]': 500},
+        headers=headers,
+    )
+    assert response.status == HTTPStatus.OK
+    expected = response.body['data']
+    assert response.body['meta']['next_after'] is None
+
+    pages = []
+    params = {'page[size]': 2}
+    while True:
+        response = await make_get_request(
+            endpoint=f'{test_settings.payments_router_prefix}', params=params, headers=headers,
+        )
+        assert response.status == HTTPStatus.OK
+        pages.append(response.body['data'])
+        next_after = response.body['meta']['next_after']
+        if next_after is None:
+            break
+        params = {'page[size]': 2, 'page[after]': next_after}
+        assert len(pages) <= len(expected)
+
+    # Страницы курсора вместе дают тот же список, что и одна большая страница: без пропусков и повторов
+    assert [payment for page in pages for payment in page] == expected
+    assert len(expected) >= len(paid_payments)
+    assert all(len(page) == 2 for page in pages[:-1])
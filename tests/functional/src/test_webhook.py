@@ -0,0 +1,26 @@
+import asyncio
+import uuid
+from http import HTTPStatus
+
+import pytest
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_event(event_id: str) -> dict:
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': 'payment_intent.created',
+        'data': {'object': {'id': f'pi_{event_id}', 'object': 'payment_intent', 'status': 'requires_payment_method'}},
+    }
+
+
+async def test_concurrent_webhooks_are_saved(make_webhook_request):
+    # С EVENT_BUFFER_ENABLED события попадают в одну пачку и вставляются одним запросом
+    event_ids = [f'evt_{uuid.uuid4().hex}' for _ in range(20)]
+    responses = await asyncio.gather(*(make_webhook_request(make_event(event_id)) for event_id in event_ids))
+    assert [response.status for response in responses] == [HTTPStatus.OK] * len(event_ids)
+
+    response = await make_webhook_request(make_event(event_ids[0]))
+    assert response.status == HTTPStatus.CONFLICT